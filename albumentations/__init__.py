@@ -1,9 +1,32 @@
 from __future__ import absolute_import
 
+import sys
+import types
+
 __version__ = '0.2.2'
 
 from .core.composition import *
 from .core.transforms_interface import *
 from .augmentations.transforms import *
 from .augmentations.bbox_utils import *
-from .imgaug.transforms import *
+from .core.optimization import *
+from .core.profiling import *
+
+
+class _LazyModule(types.ModuleType):
+    """Imports imgaug-based transforms on the first access, since imgaug pulls in scipy and
+    scikit-image, which take most of the import time of the package."""
+
+    def __getattr__(self, name):
+        if 'IAA' not in name:
+            raise AttributeError("module '{}' has no attribute '{}'".format(self.__name__, name))
+
+        from .imgaug import transforms as iaa_transforms
+
+        for attr in iaa_transforms.__all__:
+            setattr(self, attr, getattr(iaa_transforms, attr))
+
+        return getattr(iaa_transforms, name)
+
+
+sys.modules[__name__].__class__ = _LazyModule
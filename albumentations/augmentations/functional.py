@@ -6,7 +6,6 @@ from warnings import warn
 
 import cv2
 import numpy as np
-from scipy.ndimage.filters import gaussian_filter
 
 from albumentations.augmentations.bbox_utils import denormalize_bbox, normalize_bbox
 
@@ -680,7 +679,12 @@ def optical_distortion(img, k=0, dx=0, dy=0, interpolation=cv2.INTER_LINEAR, bor
         |  http://www.coldvision.io/2017/03/02/advanced-lane-finding-using-opencv/
     """
     height, width = img.shape[:2]
+    map1, map2 = optical_distortion_maps(height, width, k, dx, dy)
+    img = cv2.remap(img, map1, map2, interpolation=interpolation, borderMode=border_mode)
+    return img
+
 
+def optical_distortion_maps(height, width, k=0, dx=0, dy=0, map_type=cv2.CV_32FC1):
     fx = width
     fy = width
 
@@ -692,9 +696,7 @@ def optical_distortion(img, k=0, dx=0, dy=0, interpolation=cv2.INTER_LINEAR, bor
                               [0, 0, 1]], dtype=np.float32)
 
     distortion = np.array([k, k, 0, 0, 0], dtype=np.float32)
-    map1, map2 = cv2.initUndistortRectifyMap(camera_matrix, distortion, None, None, (width, height), cv2.CV_32FC1)
-    img = cv2.remap(img, map1, map2, interpolation=interpolation, borderMode=border_mode)
-    return img
+    return cv2.initUndistortRectifyMap(camera_matrix, distortion, None, None, (width, height), map_type)
 
 
 @preserve_shape
@@ -705,7 +707,12 @@ def grid_distortion(img, num_steps=10, xsteps=[], ysteps=[], interpolation=cv2.I
         http://pythology.blogspot.sg/2014/03/interpolation-on-regular-distorted-grid.html
     """
     height, width = img.shape[:2]
+    map_x, map_y = grid_distortion_maps(height, width, num_steps, xsteps, ysteps)
+    img = cv2.remap(img, map_x, map_y, interpolation=interpolation, borderMode=border_mode)
+    return img
+
 
+def grid_distortion_maps(height, width, num_steps=10, xsteps=[], ysteps=[]):
     x_step = width // num_steps
     xx = np.zeros(width, np.float32)
     prev = 0
@@ -739,8 +746,15 @@ def grid_distortion(img, num_steps=10, xsteps=[], ysteps=[], interpolation=cv2.I
     map_x, map_y = np.meshgrid(xx, yy)
     map_x = map_x.astype(np.float32)
     map_y = map_y.astype(np.float32)
-    img = cv2.remap(img, map_x, map_y, interpolation=interpolation, borderMode=border_mode)
-    return img
+    return map_x, map_y
+
+
+@preserve_shape
+def remap_fixed_point(img, map1, map2, interpolation=cv2.INTER_LINEAR, border_mode=cv2.BORDER_REFLECT_101):
+    """Applies remap tables produced by cv2.convertMaps with CV_16SC2 type. Nearest neighbour
+    interpolation uses only the integer part of coordinates, which is truncated.
+    """
+    return cv2.remap(img, map1, map2, interpolation=interpolation, borderMode=border_mode)
 
 
 @preserve_shape
@@ -784,6 +798,8 @@ def elastic_transform(image, alpha, sigma, alpha_affine, interpolation=cv2.INTER
         cv2.GaussianBlur(dy, (17, 17), sigma, dst=dy)
         dy *= alpha
     else:
+        from scipy.ndimage.filters import gaussian_filter  # scipy is slow to import
+
         dx = np.float32(gaussian_filter((random_state.rand(height, width) * 2 - 1), sigma) * alpha)
         dy = np.float32(gaussian_filter((random_state.rand(height, width) * 2 - 1), sigma) * alpha)
 
@@ -854,7 +870,7 @@ def channel_shuffle(img, channels_shuffled):
 def gamma_transform(img, gamma):
     if img.dtype == np.uint8:
         invGamma = 1.0 / gamma
-        table = np.array([((i / 255.0) ** invGamma) * 255 for i in np.arange(0, 256)]).astype("uint8")
+        table = (((np.arange(0, 256) / 255.0) ** invGamma) * 255).astype("uint8")
         img = cv2.LUT(img, table)
     else:
         img = np.power(img, gamma)
@@ -868,6 +884,86 @@ def gauss_noise(image, gauss):
     return image + gauss
 
 
+def sharpen_kernel(alpha, lightness):
+    """The same kernel as imgaug's Sharpen uses."""
+    nochange = np.array([[0, 0, 0], [0, 1, 0], [0, 0, 0]], dtype=np.float32)
+    effect = np.array([[-1, -1, -1], [-1, 8 + lightness, -1], [-1, -1, -1]], dtype=np.float32)
+    return (1 - alpha) * nochange + alpha * effect
+
+
+def emboss_kernel(alpha, strength):
+    """The same kernel as imgaug's Emboss uses."""
+    nochange = np.array([[0, 0, 0], [0, 1, 0], [0, 0, 0]], dtype=np.float32)
+    effect = np.array([[-1 - strength, 0 - strength, 0],
+                       [0 - strength, 1, 0 + strength],
+                       [0, 0 + strength, 1 + strength]], dtype=np.float32)
+    return (1 - alpha) * nochange + alpha * effect
+
+
+@preserve_channel_dim
+def convolve(img, kernel):
+    return cv2.filter2D(img, -1, kernel)
+
+
+def additive_noise(img, noise):
+    """Adds noise of shape (height, width, 1) or of the shape of the image."""
+    if img.dtype != np.uint8:
+        return img + noise
+
+    res = img.astype(np.float32)
+    res += noise
+    res += 0.5  # rounding, as truncation of non-negative values follows
+    np.clip(res, 0, 255, out=res)
+    return res.astype(np.uint8)
+
+
+def add_noise_saturated(img, noise):
+    """Adds int16 noise of shape (height, width, channels) to uint8 image with saturation."""
+    if img.ndim == 2:
+        noise = noise[..., 0]
+    return cv2.add(img, noise, dtype=cv2.CV_8U)
+
+
+def piecewise_affine_maps(height, width, jitter_y, jitter_x):
+    """Builds remap tables for a regular mesh of points placed from edge to edge, which are moved
+    by jitter (arrays of shape (nb_rows, nb_cols) in pixels). Displacements are interpolated
+    bilinearly inside of mesh cells.
+    """
+    nb_rows, nb_cols = jitter_y.shape
+    ys = np.linspace(0, height, nb_rows)
+    xs = np.linspace(0, width, nb_cols)
+
+    # moved points stay inside of the image, as in imgaug
+    dy = np.clip(ys[:, np.newaxis] + jitter_y, 0, height - 1) - ys[:, np.newaxis]
+    dx = np.clip(xs[np.newaxis, :] + jitter_x, 0, width - 1) - xs[np.newaxis, :]
+
+    weights_y = mesh_interpolation_weights(height, nb_rows)
+    weights_x = mesh_interpolation_weights(width, nb_cols)
+
+    map_x = np.dot(np.dot(weights_y, dx), weights_x.T) + np.arange(width, dtype=np.float32)
+    map_y = np.dot(np.dot(weights_y, dy), weights_x.T) + np.arange(height, dtype=np.float32)[:, np.newaxis]
+    return map_x.astype(np.float32), map_y.astype(np.float32)
+
+
+def mesh_interpolation_weights(size, num_points):
+    """Returns matrix of shape (size, num_points) of linear interpolation weights of every pixel
+    between points of linspace(0, size, num_points).
+    """
+    pos = np.arange(size, dtype=np.float32) * (num_points - 1) / size
+    idx = np.minimum(pos.astype(np.int64), num_points - 2)
+    frac = pos - idx
+
+    weights = np.zeros((size, num_points), dtype=np.float32)
+    weights[np.arange(size), idx] = 1 - frac
+    weights[np.arange(size), idx + 1] = frac
+    return weights
+
+
+@preserve_shape
+def remap(img, map_x, map_y, interpolation=cv2.INTER_LINEAR, border_mode=cv2.BORDER_CONSTANT, value=0):
+    return cv2.remap(img, map_x, map_y, interpolation=interpolation, borderMode=border_mode, borderValue=value)
+
+
 @clipped
 def brightness_contrast_adjust(img, alpha=1, beta=0):
     img = img.astype('float32')
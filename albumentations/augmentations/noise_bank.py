@@ -0,0 +1,64 @@
+from __future__ import division
+
+import random
+
+import numpy as np
+
+__all__ = ['NoiseBank']
+
+
+class NoiseBank(object):
+    """Precomputed Gaussian noise in pixel units, stored as int16 tiles, one tile per noise level.
+
+    Standard deviations from `sigma_limit` are quantized into `num_levels` levels. A sample is a window
+    of the tile of the nearest level at a random offset, optionally flipped vertically, so no random
+    numbers are generated per image. Tiles are built lazily, so every DataLoader worker gets its own bank.
+
+    Args:
+        sigma_limit ((float, float)): range of standard deviations of the noise.
+        num_levels (int): number of precomputed noise levels. Default: 8.
+        tile_size (int): size of tiles, grows if an image is bigger. Default: 512.
+        loc (float): mean of the noise. Default: 0.
+        per_channel (bool): whether channels get different noise. Default: True.
+        nonnegative (bool): whether to shift every sample by its own minimum, as GaussNoise shifts
+            the noise of every image. Tiles stay zero-mean, so the shift matches the size of the image
+            rather than the size of the tile. Default: False.
+    """
+
+    def __init__(self, sigma_limit, num_levels=8, tile_size=512, loc=0., per_channel=True, nonnegative=False):
+        self.sigmas = np.linspace(sigma_limit[0], sigma_limit[1], num_levels)
+        self.tile_size = tile_size
+        self.loc = loc
+        self.per_channel = per_channel
+        self.nonnegative = nonnegative
+        self.tiles = {}
+
+    def get_tile(self, level, num_channels):
+        key = (level, num_channels)
+        if key not in self.tiles:
+            random_state = np.random.RandomState(random.randint(0, 2 ** 32 - 1))
+            shape = (self.tile_size, self.tile_size, num_channels if self.per_channel else 1)
+            noise = random_state.normal(self.loc, self.sigmas[level], shape)
+            tile = np.clip(np.rint(noise), -255, 255).astype(np.int16)
+            self.tiles[key] = np.ascontiguousarray(np.broadcast_to(tile, shape[:2] + (num_channels,)))
+
+        return self.tiles[key]
+
+    def sample(self, height, width, num_channels, sigma):
+        """Returns int16 noise of shape (height, width, num_channels)."""
+        if max(height, width) > self.tile_size:
+            self.tile_size = max(height, width)
+            self.tiles.clear()
+
+        level = int(np.argmin(np.abs(self.sigmas - sigma)))
+        tile = self.get_tile(level, num_channels)
+
+        y = random.randint(0, self.tile_size - height)
+        x = random.randint(0, self.tile_size - width)
+        window = tile[y: y + height, x: x + width]
+
+        if self.nonnegative:
+            window = window - window.min()
+
+        # vertical flips are cheap for OpenCV, unlike horizontal ones
+        return window[::-1] if random.random() < 0.5 else window
@@ -0,0 +1,52 @@
+from __future__ import division
+
+import mmap
+
+import cv2
+import numpy as np
+
+__all__ = ['RemapBank']
+
+
+def shared_array(shape, dtype):
+    """Allocates an array in anonymous shared memory, which is inherited by forked processes."""
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return np.frombuffer(mmap.mmap(-1, size), dtype=dtype).reshape(shape)
+
+
+class RemapBank(object):
+    """A finite set of precomputed remap tables per image size.
+
+    Tables are stored in the fixed-point form of cv2.convertMaps (CV_16SC2 plus interpolation
+    weights), which is both smaller and faster to apply than float maps. Tables built before
+    DataLoader workers are forked are shared between them, tables built in a worker stay in it.
+
+    Args:
+        build_maps (callable): function of (height, width), which returns float32 map_x and map_y
+            for new random parameters.
+        num_maps (int): number of tables per image size.
+    """
+
+    def __init__(self, build_maps, num_maps=64):
+        self.build_maps = build_maps
+        self.num_maps = num_maps
+        self.tables = {}
+
+    def prepare(self, height, width):
+        key = (height, width)
+        if key in self.tables:
+            return self.tables[key]
+
+        map1 = shared_array((self.num_maps, height, width, 2), np.int16)
+        map2 = shared_array((self.num_maps, height, width), np.uint16)
+
+        for i in range(self.num_maps):
+            map_x, map_y = self.build_maps(height, width)
+            map1[i], map2[i] = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+        self.tables[key] = map1, map2
+        return map1, map2
+
+    def get(self, index, height, width):
+        map1, map2 = self.prepare(height, width)
+        return map1[index], map2[index]
@@ -9,6 +9,8 @@ import numpy as np
 
 from . import functional as F
 from .bbox_utils import union_of_bboxes, denormalize_bbox, normalize_bbox
+from .noise_bank import NoiseBank
+from .remap_bank import RemapBank
 from ..core.transforms_interface import to_tuple, DualTransform, ImageOnlyTransform
 
 __all__ = ['Blur', 'VerticalFlip', 'HorizontalFlip', 'Flip', 'Normalize', 'Transpose', 'RandomCrop', 'RandomGamma',
@@ -18,7 +20,8 @@ __all__ = ['Blur', 'VerticalFlip', 'HorizontalFlip', 'Flip', 'Normalize', 'Trans
            'JpegCompression', 'Cutout', 'ToFloat', 'FromFloat', 'Crop', 'RandomScale', 'LongestMaxSize',
            'SmallestMaxSize', 'Resize', 'RandomSizedCrop', 'RandomBrightnessContrast', 'RandomCropNearBBox',
            'RandomSizedBBoxSafeCrop', 'RandomSnow', 'RandomRain', 'RandomFog', 'RandomSunFlare',
-           'RandomShadow']
+           'RandomShadow', 'BankedOpticalDistortion', 'BankedGridDistortion', 'PiecewiseAffine',
+           'AdditiveGaussianNoise', 'Sharpen', 'Emboss']
 
 
 class PadIfNeeded(DualTransform):
@@ -750,6 +753,123 @@ class GridDistortion(DualTransform):
         }
 
 
+class BankedOpticalDistortion(OpticalDistortion):
+    """OpticalDistortion, which draws remap tables from a bank of `num_maps` tables per image size
+    instead of building float maps for every image. Call `prepare` before DataLoader workers are
+    started to share tables between them.
+
+    Targets:
+        image, mask
+
+    Image types:
+        uint8, float32
+    """
+
+    def __init__(self, distort_limit=0.05, shift_limit=0.05, num_maps=64, interpolation=cv2.INTER_LINEAR,
+                 border_mode=cv2.BORDER_REFLECT_101, always_apply=False, p=0.5):
+        super(BankedOpticalDistortion, self).__init__(distort_limit, shift_limit, interpolation, border_mode,
+                                                      always_apply, p)
+        self.bank = RemapBank(self.build_maps, num_maps)
+
+    def build_maps(self, height, width):
+        return F.optical_distortion_maps(height, width, **OpticalDistortion.get_params(self))
+
+    def prepare(self, height, width):
+        self.bank.prepare(height, width)
+
+    def apply(self, img, index=0, interpolation=cv2.INTER_LINEAR, **params):
+        map1, map2 = self.bank.get(index, img.shape[0], img.shape[1])
+        return F.remap_fixed_point(img, map1, map2, interpolation, self.border_mode)
+
+    def get_params(self):
+        return {'index': random.randrange(self.bank.num_maps)}
+
+
+class BankedGridDistortion(GridDistortion):
+    """GridDistortion, which draws remap tables from a bank of `num_maps` tables per image size
+    instead of building float maps for every image. Call `prepare` before DataLoader workers are
+    started to share tables between them.
+
+    Targets:
+        image, mask
+
+    Image types:
+        uint8, float32
+    """
+
+    def __init__(self, num_steps=5, distort_limit=0.3, num_maps=64, interpolation=cv2.INTER_LINEAR,
+                 border_mode=cv2.BORDER_REFLECT_101, always_apply=False, p=0.5):
+        super(BankedGridDistortion, self).__init__(num_steps, distort_limit, interpolation, border_mode,
+                                                   always_apply, p)
+        self.bank = RemapBank(self.build_maps, num_maps)
+
+    def build_maps(self, height, width):
+        params = GridDistortion.get_params(self)
+        return F.grid_distortion_maps(height, width, self.num_steps, params['stepsx'], params['stepsy'])
+
+    def prepare(self, height, width):
+        self.bank.prepare(height, width)
+
+    def apply(self, img, index=0, interpolation=cv2.INTER_LINEAR, **params):
+        map1, map2 = self.bank.get(index, img.shape[0], img.shape[1])
+        return F.remap_fixed_point(img, map1, map2, interpolation, self.border_mode)
+
+    def get_params(self):
+        return {'index': random.randrange(self.bank.num_maps)}
+
+
+class PiecewiseAffine(DualTransform):
+    """Place a regular grid of points on the input and randomly move the neighbourhood of these point around.
+    The same as IAAPiecewiseAffine, but displacements are interpolated over the mesh cells and applied
+    with a single cv2.remap instead of scikit-image warps.
+
+    Args:
+        scale ((float, float): factor range that determines how far each point is moved. Default: (0.03, 0.05).
+        nb_rows (int): number of rows of points that the regular grid should have. Default: 4.
+        nb_cols (int): number of columns of points that the regular grid should have. Default: 4.
+        order (int): 0 for nearest neighbour, 1 for bilinear and 3 for bicubic interpolation. Default: 1.
+        cval (int): value of pixels outside of the image when mode is 'constant'. Default: 0.
+        mode (str): 'constant', 'edge', 'symmetric', 'reflect' or 'wrap'. Default: 'constant'.
+        p (float): probability of applying the transform. Default: 0.5.
+
+    Targets:
+        image, mask
+
+    Image types:
+        uint8, float32
+    """
+
+    ORDERS = {0: cv2.INTER_NEAREST, 1: cv2.INTER_LINEAR, 3: cv2.INTER_CUBIC}
+    MODES = {'constant': cv2.BORDER_CONSTANT, 'edge': cv2.BORDER_REPLICATE, 'symmetric': cv2.BORDER_REFLECT,
+             'reflect': cv2.BORDER_REFLECT_101, 'wrap': cv2.BORDER_WRAP}
+
+    def __init__(self, scale=(0.03, 0.05), nb_rows=4, nb_cols=4, order=1, cval=0, mode='constant',
+                 always_apply=False, p=.5):
+        super(PiecewiseAffine, self).__init__(always_apply, p)
+        self.scale = to_tuple(scale, 0.)
+        self.nb_rows = nb_rows
+        self.nb_cols = nb_cols
+        self.interpolation = self.ORDERS[order]
+        self.cval = cval
+        self.border_mode = self.MODES[mode]
+
+    def apply(self, img, map_x=None, map_y=None, interpolation=cv2.INTER_LINEAR, **params):
+        return F.remap(img, map_x, map_y, interpolation, self.border_mode, self.cval)
+
+    @property
+    def targets_as_params(self):
+        return ['image']
+
+    def get_params_dependent_on_targets(self, params):
+        height, width = params['image'].shape[:2]
+        scale = random.uniform(self.scale[0], self.scale[1])
+
+        random_state = np.random.RandomState(random.randint(0, 2 ** 32 - 1))
+        jitter = random_state.normal(0, scale, (2, self.nb_rows, self.nb_cols))
+        map_x, map_y = F.piecewise_affine_maps(height, width, jitter[0] * height, jitter[1] * width)
+        return {'map_x': map_x, 'map_y': map_y}
+
+
 class ElasticTransform(DualTransform):
     """Elastic deformation of images as described in [Simard2003]_ (with modifications).
     Based on https://gist.github.com/erniejunior/601cdf56d2b424757de5
@@ -1500,6 +1620,8 @@ class GaussNoise(ImageOnlyTransform):
     Args:
         var_limit ((float, float) or float): variance range for noise. If var_limit is a single float, the range
             will be (-var_limit, var_limit). Default: (10., 50.).
+        use_bank (bool): whether to take noise of uint8 images from a bank of precomputed tiles,
+            see `NoiseBank`. Default: False.
         p (float): probability of applying the transform. Default: 0.5.
 
     Targets:
@@ -1509,16 +1631,25 @@ class GaussNoise(ImageOnlyTransform):
         uint8
     """
 
-    def __init__(self, var_limit=(10., 50.), always_apply=False, p=0.5):
+    def __init__(self, var_limit=(10., 50.), use_bank=False, always_apply=False, p=0.5):
         super(GaussNoise, self).__init__(always_apply, p)
         self.var_limit = to_tuple(var_limit)
+        self.bank = NoiseBank((self.var_limit[0] ** 0.5, self.var_limit[1] ** 0.5), nonnegative=True) \
+            if use_bank else None
 
-    def apply(self, img, gauss=None, **params):
+    def apply(self, img, gauss=None, noise=None, **params):
+        if noise is not None:
+            return F.add_noise_saturated(img, noise)
         return F.gauss_noise(img, gauss=gauss)
 
     def get_params_dependent_on_targets(self, params):
         image = params['image']
         var = random.uniform(self.var_limit[0], self.var_limit[1])
+
+        if self.bank is not None and image.dtype == np.uint8:
+            num_channels = image.shape[2] if image.ndim == 3 else 1
+            return {'noise': self.bank.sample(image.shape[0], image.shape[1], num_channels, var ** 0.5)}
+
         mean = var
         sigma = var ** 0.5
         random_state = np.random.RandomState(random.randint(0, 2 ** 32 - 1))
@@ -1533,6 +1664,120 @@ class GaussNoise(ImageOnlyTransform):
         return ['image']
 
 
+class AdditiveGaussianNoise(ImageOnlyTransform):
+    """Add gaussian noise to the input image. The same as IAAAdditiveGaussianNoise without imgaug.
+
+    Args:
+        loc (int): mean of the normal distribution that generates the noise. Default: 0.
+        scale ((float, float)): standard deviation of the normal distribution that generates the noise.
+            Default: (0.01 * 255, 0.05 * 255).
+        per_channel (bool): whether to draw noise for every channel or share it between channels. Default: False.
+        use_bank (bool): whether to take noise of uint8 images from a bank of precomputed tiles,
+            see `NoiseBank`. Default: False.
+        p (float): probability of applying the transform. Default: 0.5.
+
+    Targets:
+        image
+
+    Image types:
+        uint8, float32
+    """
+
+    def __init__(self, loc=0, scale=(0.01 * 255, 0.05 * 255), per_channel=False, use_bank=False,
+                 always_apply=False, p=0.5):
+        super(AdditiveGaussianNoise, self).__init__(always_apply, p)
+        self.loc = loc
+        self.scale = to_tuple(scale, 0.)
+        self.per_channel = per_channel
+        self.bank = NoiseBank(self.scale, loc=loc, per_channel=per_channel) if use_bank else None
+
+    def apply(self, img, noise=None, **params):
+        if noise.dtype == np.int16:
+            return F.add_noise_saturated(img, noise)
+        return F.additive_noise(img, noise)
+
+    @property
+    def targets_as_params(self):
+        return ['image']
+
+    def get_params_dependent_on_targets(self, params):
+        image = params['image']
+        shape = image.shape if self.per_channel or image.ndim == 2 else image.shape[:2] + (1,)
+        scale = random.uniform(self.scale[0], self.scale[1])
+
+        if self.bank is not None and image.dtype == np.uint8:
+            num_channels = image.shape[2] if image.ndim == 3 else 1
+            return {'noise': self.bank.sample(image.shape[0], image.shape[1], num_channels, scale)}
+
+        # OpenCV generator is several times faster than numpy one
+        noise = np.empty((shape[0], int(np.prod(shape[1:]))), dtype=np.float32)
+        cv2.setRNGSeed(random.randint(0, 2 ** 31 - 1))
+        cv2.randn(noise, self.loc, scale)
+        return {'noise': noise.reshape(shape)}
+
+
+class Sharpen(ImageOnlyTransform):
+    """Sharpen the input image and overlays the result with the original image. The same as IAASharpen
+    without imgaug.
+
+    Args:
+        alpha ((float, float)): range to choose the visibility of the sharpened image. At 0, only the original image is
+            visible, at 1.0 only its sharpened version is visible. Default: (0.2, 0.5).
+        lightness ((float, float)): range to choose the lightness of the sharpened image. Default: (0.5, 1.0).
+        p (float): probability of applying the transform. Default: 0.5.
+
+    Targets:
+        image
+
+    Image types:
+        uint8, float32
+    """
+
+    def __init__(self, alpha=(0.2, 0.5), lightness=(0.5, 1.), always_apply=False, p=0.5):
+        super(Sharpen, self).__init__(always_apply, p)
+        self.alpha = to_tuple(alpha, 0)
+        self.lightness = to_tuple(lightness, 0)
+
+    def apply(self, img, kernel=None, **params):
+        return F.convolve(img, kernel)
+
+    def get_params(self):
+        alpha = random.uniform(self.alpha[0], self.alpha[1])
+        lightness = random.uniform(self.lightness[0], self.lightness[1])
+        return {'kernel': F.sharpen_kernel(alpha, lightness)}
+
+
+class Emboss(ImageOnlyTransform):
+    """Emboss the input image and overlays the result with the original image. The same as IAAEmboss
+    without imgaug.
+
+    Args:
+        alpha ((float, float)): range to choose the visibility of the embossed image. At 0, only the original image is
+            visible,at 1.0 only its embossed version is visible. Default: (0.2, 0.5).
+        strength ((float, float)): strength range of the embossing. Default: (0.2, 0.7).
+        p (float): probability of applying the transform. Default: 0.5.
+
+    Targets:
+        image
+
+    Image types:
+        uint8, float32
+    """
+
+    def __init__(self, alpha=(0.2, 0.5), strength=(0.2, 0.7), always_apply=False, p=0.5):
+        super(Emboss, self).__init__(always_apply, p)
+        self.alpha = to_tuple(alpha, 0.)
+        self.strength = to_tuple(strength, 0.)
+
+    def apply(self, img, kernel=None, **params):
+        return F.convolve(img, kernel)
+
+    def get_params(self):
+        alpha = random.uniform(self.alpha[0], self.alpha[1])
+        strength = random.uniform(self.strength[0], self.strength[1])
+        return {'kernel': F.emboss_kernel(alpha, strength)}
+
+
 class CLAHE(ImageOnlyTransform):
     """Apply Contrast Limited Adaptive Histogram Equalization to the input image.
 
@@ -1,14 +1,15 @@
 from __future__ import division
 
 import random
+import sys
 import warnings
 
 import numpy as np
 
 from albumentations.augmentations.keypoints_utils import convert_keypoints_from_albumentations, filter_keypoints, \
     convert_keypoints_to_albumentations, check_keypoints
+from albumentations.core.profiling import profiler
 from albumentations.core.transforms_interface import DualTransform
-from albumentations.imgaug.transforms import DualIAATransform
 from albumentations.augmentations.bbox_utils import convert_bboxes_from_albumentations, \
     convert_bboxes_to_albumentations, filter_bboxes, check_bboxes
 
@@ -126,9 +127,11 @@ class Compose(BaseCompose):
         # IAA-based augmentations supports only transformation of xy keypoints.
         # If your keypoints formats is other than 'xy' we emit warning to let user
         # be aware that angle and size will not be modified.
-        if self.keypoints_format is not None and self.keypoints_format != 'xy':
+        # There can be no such transforms if the imgaug module hasn't been imported yet.
+        iaa_module = sys.modules.get('albumentations.imgaug.transforms')
+        if self.keypoints_format is not None and self.keypoints_format != 'xy' and iaa_module is not None:
             for transform in self.transforms:
-                if isinstance(transform, DualIAATransform):
+                if isinstance(transform, iaa_module.DualIAATransform):
                     warnings.warn("{} transformation supports only 'xy' keypoints "
                                   "augmentation. You have '{}' keypoints format. Scale "
                                   "and angle WILL NOT BE transformed.".format(transform.__class__.__name__,
@@ -168,7 +171,7 @@ class Compose(BaseCompose):
                     data = data_preprocessing(self.keypoints_name, self.params[self.keypoints_name], check_keypoints,
                                               convert_keypoints_to_albumentations, data)
 
-            data = t(force_apply=force_apply, **data)
+            data = profiler.run(t, data, force_apply=force_apply)
 
             if dual_start_end is not None and idx == dual_start_end[1]:
                 if self.params[self.bboxes_name]:
@@ -257,7 +260,7 @@ class OneOf(BaseCompose):
         if force_apply or random.random() < self.p:
             random_state = np.random.RandomState(random.randint(0, 2 ** 32 - 1))
             t = random_state.choice(self.transforms, p=self.transforms_ps)
-            data = t(force_apply=True, **data)
+            data = profiler.run(t, data, force_apply=True)
         return data
 
 
@@ -267,6 +270,6 @@ class OneOrOther(BaseCompose):
 
     def __call__(self, force_apply=False, **data):
         if random.random() < self.p:
-            return self.transforms[0](force_apply=True, **data)
+            return profiler.run(self.transforms[0], data, force_apply=True)
         else:
-            return self.transforms[-1](force_apply=True, **data)
+            return profiler.run(self.transforms[-1], data, force_apply=True)
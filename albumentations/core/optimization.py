@@ -0,0 +1,329 @@
+from __future__ import division
+
+import random
+
+import cv2
+import numpy as np
+
+from albumentations.augmentations import functional as F
+from albumentations.augmentations.transforms import PadIfNeeded, RandomCrop, CenterCrop, HorizontalFlip, \
+    VerticalFlip, RandomRotate90, ShiftScaleRotate, RandomGamma, RGBShift, InvertImg, RandomBrightnessContrast
+from albumentations.core.composition import Compose, OneOf
+from albumentations.core.transforms_interface import DualTransform, ImageOnlyTransform
+
+__all__ = ['FusedGeometric', 'fuse_geometric', 'FusedLUT', 'fuse_color', 'fusion_report']
+
+
+FUSIBLE_TRANSFORMS = (PadIfNeeded, RandomCrop, CenterCrop, HorizontalFlip, VerticalFlip, RandomRotate90,
+                      ShiftScaleRotate)
+
+
+def is_fusible(transform):
+    if type(transform) not in FUSIBLE_TRANSFORMS or transform.always_apply:
+        return False
+    return getattr(transform, 'border_mode', cv2.BORDER_REFLECT_101) == cv2.BORDER_REFLECT_101
+
+
+def translation_matrix(dx, dy):
+    return np.array([[1, 0, dx], [0, 1, dy], [0, 0, 1]], dtype=np.float64)
+
+
+def get_transform_matrix(transform, rows, cols):
+    """Returns 3x3 matrix which maps pixel coordinates of the input of transform into its output,
+    and the output size.
+    """
+    if isinstance(transform, PadIfNeeded):
+        pad_top = int((transform.min_height - rows) / 2.0) if rows < transform.min_height else 0
+        pad_left = int((transform.min_width - cols) / 2.0) if cols < transform.min_width else 0
+        return (translation_matrix(pad_left, pad_top),
+                max(rows, transform.min_height), max(cols, transform.min_width))
+
+    elif isinstance(transform, RandomCrop):
+        params = transform.get_params()
+        if rows < transform.height or cols < transform.width:
+            raise ValueError('Requested crop size ({}, {}) is larger than the image size ({}, {})'.format(
+                transform.height, transform.width, rows, cols))
+        x1, y1, _, _ = F.get_random_crop_coords(rows, cols, transform.height, transform.width,
+                                                params['h_start'], params['w_start'])
+        return translation_matrix(-x1, -y1), transform.height, transform.width
+
+    elif isinstance(transform, CenterCrop):
+        x1, y1, _, _ = F.get_center_crop_coords(rows, cols, transform.height, transform.width)
+        return translation_matrix(-x1, -y1), transform.height, transform.width
+
+    elif isinstance(transform, HorizontalFlip):
+        return np.array([[-1, 0, cols - 1], [0, 1, 0], [0, 0, 1]], dtype=np.float64), rows, cols
+
+    elif isinstance(transform, VerticalFlip):
+        return np.array([[1, 0, 0], [0, -1, rows - 1], [0, 0, 1]], dtype=np.float64), rows, cols
+
+    elif isinstance(transform, RandomRotate90):
+        matrix = np.eye(3)
+        for _ in range(transform.get_params()['factor']):
+            # the same as np.rot90: counterclockwise rotation
+            rot = np.array([[0, 1, 0], [-1, 0, cols - 1], [0, 0, 1]], dtype=np.float64)
+            matrix = np.dot(rot, matrix)
+            rows, cols = cols, rows
+        return matrix, rows, cols
+
+    elif isinstance(transform, ShiftScaleRotate):
+        params = transform.get_params()
+        matrix = cv2.getRotationMatrix2D((cols / 2, rows / 2), params['angle'], params['scale'])
+        matrix[0, 2] += params['dx'] * cols
+        matrix[1, 2] += params['dy'] * rows
+        return np.vstack([matrix, [0, 0, 1]]), rows, cols
+
+    raise TypeError('{} cannot be fused'.format(transform.__class__.__name__))
+
+
+@F.preserve_channel_dim
+def warp_affine(img, matrix, out_rows, out_cols, interpolation):
+    return cv2.warpAffine(img, matrix, (out_cols, out_rows), flags=interpolation,
+                          borderMode=cv2.BORDER_REFLECT_101)
+
+
+class FusedGeometric(DualTransform):
+    """Applies a chain of geometric transforms with a single warpAffine call.
+
+    Every transform of the chain is applied with its own probability, the same way as in Compose.
+    Parameters of applied transforms are combined into one affine matrix, so the image is resampled
+    once, straight into the buffer of the final size. Pixels outside of the source image are
+    reflected from the whole source image, so ShiftScaleRotate after a crop sees real content
+    instead of reflected borders of the crop.
+
+    Args:
+        transforms (list): transforms to fuse, see `FUSIBLE_TRANSFORMS`.
+
+    Targets:
+        image, mask
+
+    Image types:
+        uint8, float32
+    """
+
+    def __init__(self, transforms):
+        super(FusedGeometric, self).__init__(always_apply=False, p=1.0)
+        assert all(is_fusible(t) for t in transforms)
+        self.transforms = transforms
+
+    @property
+    def targets_as_params(self):
+        return ['image']
+
+    def get_params_dependent_on_targets(self, params):
+        rows, cols = params['image'].shape[:2]
+        matrix = np.eye(3)
+        interpolation = cv2.INTER_NEAREST   # exact for integer shifts, flips and rotations
+
+        for t in self.transforms:
+            if random.random() < t.p:
+                step, rows, cols = get_transform_matrix(t, rows, cols)
+                matrix = np.dot(step, matrix)
+
+                if isinstance(t, ShiftScaleRotate):
+                    interpolation = t.interpolation
+
+        return {'matrix': matrix[:2], 'out_rows': rows, 'out_cols': cols, 'interpolation': interpolation}
+
+    def apply(self, img, matrix=None, out_rows=0, out_cols=0, interpolation=cv2.INTER_NEAREST, **params):
+        return warp_affine(img, matrix, out_rows, out_cols, interpolation)
+
+    def __repr__(self):
+        return 'FusedGeometric([{}])'.format(', '.join(t.__class__.__name__ for t in self.transforms))
+
+
+def flatten_transforms(transforms):
+    """Inlines nested Compose objects which are always applied."""
+    result = []
+    for t in transforms:
+        if type(t) == Compose and t.p >= 1 and not any(t.params.values()):
+            result.extend(flatten_transforms(t.transforms))
+        else:
+            result.append(t)
+    return result
+
+
+def fuse_geometric(compose):
+    """Returns an equivalent Compose, where every chain of two or more consecutive geometric
+    transforms is replaced with FusedGeometric.
+
+    Args:
+        compose (Compose): transforms to optimize. Bounding boxes and keypoints are not supported.
+    """
+    if any(compose.params.values()):
+        return compose
+
+    transforms, chain = [], []
+
+    def flush_chain():
+        if len(chain) > 1:
+            transforms.append(FusedGeometric(list(chain)))
+        else:
+            transforms.extend(chain)
+        del chain[:]
+
+    for t in flatten_transforms(compose.transforms):
+        if is_fusible(t):
+            chain.append(t)
+            continue
+
+        flush_chain()
+        transforms.append(fuse_geometric(t) if type(t) == Compose else t)
+
+    flush_chain()
+    return Compose(transforms, p=compose.p)
+
+
+POINTWISE_TRANSFORMS = (RandomGamma, RGBShift, InvertImg, RandomBrightnessContrast)
+
+
+def is_pointwise(transform):
+    return isinstance(transform, POINTWISE_TRANSFORMS) and not transform.always_apply
+
+
+def get_lut(transform, params, lut, mean=None):
+    """Composes a per-channel uint8 lookup table of shape (channels, 256) with the transform.
+    The result of every step is clipped and rounded the same way as the functional version does.
+
+    Args:
+        mean (float): mean pixel value of the image after the previous steps, used by transforms
+            which depend on it.
+    """
+    values = np.arange(256, dtype=np.float32)
+
+    if isinstance(transform, RandomGamma):
+        table = ((np.arange(256) / 255.0) ** (1.0 / params['gamma'])) * 255
+        tables = [table.astype(np.uint8)] * lut.shape[0]
+    elif isinstance(transform, RGBShift):
+        shifts = np.int32(params['r_shift']), np.int32(params['g_shift']), np.int32(params['b_shift'])
+        tables = [F.clip(np.arange(256) + shift, np.uint8, 255) for shift in shifts[:lut.shape[0]]]
+    elif isinstance(transform, InvertImg):
+        tables = [255 - np.arange(256, dtype=np.uint8)] * lut.shape[0]
+    elif isinstance(transform, RandomBrightnessContrast):
+        mean *= params['alpha']
+        tables = [F.clip(values * params['alpha'] + params['beta'] * mean, np.uint8, 255)] * lut.shape[0]
+    else:
+        raise TypeError('{} cannot be fused'.format(transform.__class__.__name__))
+
+    return np.stack([table[channel] for table, channel in zip(tables, lut)])
+
+
+class FusedLUT(ImageOnlyTransform):
+    """Applies a chain of pointwise color transforms with a single cv2.LUT call.
+
+    Tables of applied transforms are composed into one 256-entry table per channel. When there are
+    several transforms, each of them is applied with its own probability, the same way as in Compose.
+    A single transform is applied with the probability of FusedLUT, so it can replace the transform
+    inside of OneOf. Images other than uint8 are processed by the original transforms.
+
+    Args:
+        transforms (list): transforms to fuse, see `POINTWISE_TRANSFORMS`.
+        p (float): probability of applying the transform. Default: 1.0.
+
+    Targets:
+        image
+
+    Image types:
+        uint8, float32
+    """
+
+    def __init__(self, transforms, always_apply=False, p=1.0):
+        super(FusedLUT, self).__init__(always_apply, p)
+        assert all(is_pointwise(t) for t in transforms)
+        self.transforms = transforms
+
+    @property
+    def targets_as_params(self):
+        return ['image']
+
+    def get_params_dependent_on_targets(self, params):
+        if len(self.transforms) == 1:
+            applied = self.transforms
+        else:
+            applied = [t for t in self.transforms if random.random() < t.p]
+
+        return {'applied': [(t, t.get_params()) for t in applied]}
+
+    def apply(self, img, applied=(), **params):
+        if img.dtype != np.uint8:
+            for t, t_params in applied:
+                img = t.apply(img, **t_params)
+            return img
+
+        num_channels = img.shape[2] if img.ndim == 3 else 1
+        identity = np.arange(256, dtype=np.uint8)
+        lut = np.tile(identity, (num_channels, 1))
+        hist = None
+
+        for t, t_params in applied:
+            mean = None
+            if isinstance(t, RandomBrightnessContrast):
+                if np.all(lut == identity):
+                    mean = np.mean(cv2.mean(img)[:num_channels])
+                else:
+                    # the mean of the image after the previous steps is computed from histograms
+                    if hist is None:
+                        hist = np.stack([cv2.calcHist([img], [c], None, [256], [0, 256]).ravel()
+                                         for c in range(num_channels)])
+                    mean = np.sum(hist * lut) / np.sum(hist)
+
+            lut = get_lut(t, t_params, lut, mean)
+
+        if img.ndim == 2 or np.all(lut == lut[0]):
+            return cv2.LUT(img, lut[0])
+        return cv2.LUT(img, np.ascontiguousarray(lut.T.reshape(256, 1, num_channels)))
+
+    def __repr__(self):
+        return 'FusedLUT([{}])'.format(', '.join(t.__class__.__name__ for t in self.transforms))
+
+
+def fuse_color(transforms):
+    """Returns an equivalent Compose or OneOf, where every chain of consecutive pointwise color
+    transforms is replaced with FusedLUT. Nested Compose and OneOf objects are processed as well.
+
+    Args:
+        transforms (Compose or OneOf): transforms to optimize.
+    """
+    if isinstance(transforms, OneOf):
+        return OneOf([FusedLUT([t], p=t.p) if is_pointwise(t) else fuse_color(t) for t in transforms.transforms],
+                     p=transforms.p)
+
+    if type(transforms) != Compose or any(transforms.params.values()):
+        return transforms
+
+    result, chain = [], []
+
+    def flush_chain():
+        if len(chain) == 1:
+            result.append(FusedLUT(list(chain), p=chain[0].p))
+        elif chain:
+            result.append(FusedLUT(list(chain)))
+        del chain[:]
+
+    for t in transforms.transforms:
+        if is_pointwise(t):
+            chain.append(t)
+            continue
+
+        flush_chain()
+        result.append(fuse_color(t))
+
+    flush_chain()
+    return Compose(result, p=transforms.p)
+
+
+def fusion_report(transforms):
+    """Returns a string with the number of transforms replaced with fused ones."""
+    counts = {FusedGeometric: [0, 0], FusedLUT: [0, 0]}
+
+    def visit(t):
+        if type(t) in counts:
+            counts[type(t)][0] += 1
+            counts[type(t)][1] += len(t.transforms)
+        elif isinstance(t, (Compose, OneOf)):
+            for child in t.transforms:
+                visit(child)
+
+    visit(transforms)
+    return ', '.join('{}: {} ops in {} groups'.format(cls.__name__, ops, groups)
+                     for cls, (groups, ops) in counts.items())
@@ -0,0 +1,230 @@
+from __future__ import division
+
+import glob
+import json
+import multiprocessing.util
+import os
+import signal
+import time
+from collections import defaultdict
+
+from albumentations.core.transforms_interface import BasicTransform
+
+__all__ = ['Profiler', 'profiler']
+
+
+FLUSH_INTERVAL = 1.0
+SYNC_TIMEOUT = 2.0
+OUTPUT_DIR_ENV = 'ALBU_PROFILE_DIR'
+GENERATION_FILE = 'generation'
+SYNC_SIGNAL = getattr(signal, 'SIGUSR1', None)
+
+
+class Profiler(object):
+    """Collects per-transform statistics: number of calls, number of times the transform was applied
+    and wall time. Only transforms are measured, time of Compose and OneOf goes to their children.
+
+    Every process keeps its own statistics. When output_dir is set, they are dumped into
+    `output_dir/<pid>.json` at most once per `FLUSH_INTERVAL` seconds, so statistics of DataLoader
+    workers can be aggregated by the main process. Workers dump the rest on exit.
+    The directory is also passed through an environment variable, so spawned workers are profiled too.
+
+    Persistent workers never exit, so reset() and report() also reach them: reset() bumps the
+    generation number in `output_dir/generation`, and both send SIGUSR1 to live workers, which
+    drop statistics of older generations and dump their current ones. Dumps of other generations
+    are ignored.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.output_dir = None
+        self.stats = defaultdict(lambda: [0, 0, 0.0])
+        self.last_flush = 0.0
+        self.pid = None
+        self.generation = 0
+        self.busy = False
+        self.sync_pending = False
+
+    def enable(self, output_dir=None):
+        self.enabled = True
+        self.output_dir = output_dir
+
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+            os.environ[OUTPUT_DIR_ENV] = output_dir
+
+    def disable(self):
+        self.enabled = False
+        os.environ.pop(OUTPUT_DIR_ENV, None)
+
+    def run(self, transform, data, force_apply=False):
+        if not self.enabled or not isinstance(transform, BasicTransform):
+            return transform(force_apply=force_apply, **data)
+
+        if self.pid != os.getpid():
+            self._attach_to_process()
+
+        start = time.time()
+        result = transform(force_apply=force_apply, **data)
+        now = time.time()
+
+        # the signal handler must not touch statistics, while they're being updated or dumped
+        self.busy = True
+        stats = self.stats[transform.__class__.__name__]
+        stats[0] += 1
+        stats[1] += result.get('image') is not data.get('image')
+        stats[2] += now - start
+
+        if self.output_dir is not None and (now - self.last_flush > FLUSH_INTERVAL or self.sync_pending):
+            self.sync_pending = False
+            self._sync()
+
+        self.busy = False
+        return result
+
+    def _attach_to_process(self):
+        # the first call in this process; statistics inherited after fork belong to the parent
+        self.pid = os.getpid()
+        self.stats.clear()
+        self.last_flush = time.time()
+
+        if self.output_dir is not None:
+            self.generation = self._read_generation()
+            self.flush()    # makes the process known to the main one
+            multiprocessing.util.Finalize(self, self.flush, exitpriority=10)
+
+            if SYNC_SIGNAL is not None:
+                try:
+                    signal.signal(SYNC_SIGNAL, self._on_signal)
+                except ValueError:  # not the main thread
+                    pass
+
+    def _on_signal(self, signum, frame):
+        if self.pid != os.getpid():     # the handler was inherited, but this process has no statistics
+            return
+
+        if self.busy:
+            self.sync_pending = True
+        else:
+            self._sync()
+
+    def _read_generation(self):
+        try:
+            with open(os.path.join(self.output_dir, GENERATION_FILE)) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def _sync(self):
+        generation = self._read_generation()
+        if generation != self.generation:
+            self.generation = generation
+            self.stats.clear()
+
+        self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+
+        path = os.path.join(self.output_dir, '{}.json'.format(os.getpid()))
+        dump = {'generation': self.generation, 'parent': os.getppid(), 'stats': self.stats}
+
+        with open(path + '.tmp', 'w') as f:
+            json.dump(dump, f)
+        os.replace(path + '.tmp', path)
+
+    def _load_dumps(self):
+        dumps = {}
+
+        for path in glob.glob(os.path.join(self.output_dir, '*.json')):
+            try:
+                with open(path) as f:
+                    dumps[path] = json.load(f)
+            except (OSError, ValueError):   # removed or being replaced
+                pass
+
+        return dumps
+
+    def _signal_workers(self, dumps):
+        """Asks live workers of this process to sync, returns paths of their dumps."""
+        paths = []
+        if SYNC_SIGNAL is None:
+            return paths
+
+        for path, dump in dumps.items():
+            pid = int(os.path.basename(path).split('.')[0])
+            if pid == os.getpid() or dump.get('parent') != os.getpid():
+                continue
+
+            try:
+                os.kill(pid, SYNC_SIGNAL)
+                paths.append(path)
+            except OSError:     # the worker has exited
+                pass
+
+        return paths
+
+    def reset(self):
+        self.stats.clear()
+
+        if self.output_dir is not None:
+            self.generation = self._read_generation() + 1
+            with open(os.path.join(self.output_dir, GENERATION_FILE), 'w') as f:
+                f.write(str(self.generation))
+
+            dumps = self._load_dumps()
+            alive = self._signal_workers(dumps)
+
+            for path in dumps:
+                if path not in alive:
+                    os.remove(path)
+
+    def collect(self):
+        """Returns statistics summed over all processes and the number of processes."""
+        if self.output_dir is None:
+            return dict(self.stats), 1
+
+        self.flush()
+        signal_time = time.time()
+        waiting = set(self._signal_workers(self._load_dumps()))
+        deadline = signal_time + SYNC_TIMEOUT
+
+        # wait until signalled workers dump their last statistics
+        while waiting and time.time() < deadline:
+            time.sleep(0.01)
+            dumps = self._load_dumps()
+            waiting = {path for path in waiting if path in dumps
+                       and (dumps[path].get('generation') != self.generation
+                            or os.path.getmtime(path) < signal_time)}
+
+        total = defaultdict(lambda: [0, 0, 0.0])
+        dumps = [dump for dump in self._load_dumps().values()
+                 if dump.get('generation') == self.generation]
+
+        for dump in dumps:
+            for name, values in dump['stats'].items():
+                total[name] = [a + b for a, b in zip(total[name], values)]
+
+        return dict(total), len(dumps)
+
+    def report(self):
+        """Returns a table of transforms ranked by the total time."""
+        stats, num_processes = self.collect()
+        total_time = sum(s[2] for s in stats.values()) or 1.0
+
+        lines = ['augmentation profile, {} processes, {:.1f} s total'.format(num_processes, total_time),
+                 '{:<28}{:>10}{:>10}{:>12}{:>10}{:>8}'.format('transform', 'calls', 'applied', 'time, s',
+                                                              'ms/call', 'share')]
+
+        for name, (calls, applied, elapsed) in sorted(stats.items(), key=lambda kv: -kv[1][2]):
+            lines.append('{:<28}{:>10}{:>9.1f}%{:>12.2f}{:>10.3f}{:>7.1f}%'.format(
+                name, calls, applied / max(calls, 1) * 100, elapsed, elapsed / max(calls, 1) * 1000,
+                elapsed / total_time * 100))
+
+        return '\n'.join(lines)
+
+
+profiler = Profiler()
+
+if os.environ.get(OUTPUT_DIR_ENV):
+    profiler.enable(os.environ[OUTPUT_DIR_ENV])
@@ -6,7 +6,9 @@ import torchvision.transforms.functional as F
 
 
 def img_to_tensor(im, normalize=None):
-    tensor = torch.from_numpy(np.moveaxis(im / (255. if im.dtype == np.uint8 else 1), -1, 0).astype(np.float32))
+    tensor = torch.from_numpy(np.ascontiguousarray(np.moveaxis(im, -1, 0))).float()
+    if im.dtype == np.uint8:
+        tensor.div_(255.)
     if normalize is not None:
         return F.normalize(tensor, **normalize)
     return tensor
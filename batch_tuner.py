@@ -0,0 +1,130 @@
+#!/usr/bin/python3.6
+''' Chooses the fastest batch size which fits into GPU memory. '''
+
+import argparse
+import json
+import os
+import time
+
+from typing import Any, Dict, List
+
+import torch
+
+from losses import get_loss
+from model import create_model
+from optimizers import get_optimizer
+from parse_config import load_config, override
+
+CACHE_PATH = '../cache/batch_tuner.json'
+
+
+def get_hardware_name() -> str:
+    if not torch.cuda.is_available():
+        return 'cpu'
+
+    return f'{torch.cuda.get_device_name(0)}x{torch.cuda.device_count()}'.replace(' ', '_')
+
+def get_cache_key(config: Any) -> str:
+    effective_batch = config.train.batch_size * config.train.accum_batches_num
+    return f'{get_hardware_name()}_{config.model.arch}_{config.model.input_size}_' \
+           f'{config.optimizer.name}_{effective_batch}'
+
+def get_candidates(effective_batch: int) -> List[int]:
+    ''' Returns batch sizes which divide the effective batch size. '''
+    num_devices = max(1, torch.cuda.device_count())
+    candidates, batch_size = [], num_devices
+
+    while batch_size <= effective_batch:
+        if effective_batch % batch_size == 0:
+            candidates.append(batch_size)
+
+        batch_size *= 2
+
+    return candidates
+
+def measure(config: Any, batch_size: int, num_steps: int) -> Dict[str, float]:
+    ''' Runs forward/backward passes, returns images/sec and peak memory in Mb. '''
+    model = create_model(config, pretrained=False).cuda()
+    criterion = get_loss(config)
+    optimizer = get_optimizer(config, model.parameters())
+    model.train()
+
+    size = config.model.input_size
+    input_ = torch.rand(batch_size, 3, size, size).cuda()
+    target = torch.zeros(batch_size, config.model.num_classes).cuda()
+
+    torch.cuda.reset_max_memory_allocated()
+
+    for i in range(num_steps + 1):
+        if i == 1:  # the first step is a warmup
+            torch.cuda.synchronize()
+            start = time.time()
+
+        loss = criterion(model(input_), target)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+    torch.cuda.synchronize()
+    elapsed = time.time() - start
+
+    return {'images_per_sec': batch_size * num_steps / elapsed,
+            'peak_memory_mb': torch.cuda.max_memory_allocated() / 2 ** 20}
+
+def probe(config: Any, num_steps: int) -> Dict[str, Any]:
+    effective_batch = config.train.batch_size * config.train.accum_batches_num
+    results: Dict[int, Dict[str, float]] = {}
+
+    for batch_size in get_candidates(effective_batch):
+        try:
+            results[batch_size] = measure(config, batch_size, num_steps)
+            print(f'batch {batch_size}: {results[batch_size]}')
+        except RuntimeError as e:
+            if 'out of memory' not in str(e):
+                raise
+
+            print(f'batch {batch_size}: out of memory')
+            break
+        finally:
+            torch.cuda.empty_cache()
+
+    assert results, 'no batch size fits into memory'
+    best = max(results.keys(), key=lambda b: results[b]['images_per_sec'])
+
+    return {'batch_size': best,
+            'accum_batches_num': effective_batch // best,
+            'probes': {str(b): res for b, res in results.items()}}
+
+def tune_batch_size(config: Any, num_steps: int = 5) -> Any:
+    ''' Returns the config with tuned batch_size and accum_batches_num, keeping the effective batch size. '''
+    if not torch.cuda.is_available():
+        return config
+
+    key = get_cache_key(config)
+    cache: Dict[str, Any] = {}
+
+    if os.path.exists(CACHE_PATH):
+        with open(CACHE_PATH) as f:
+            cache = json.load(f)
+
+    if key not in cache:
+        cache[key] = probe(config, num_steps)
+
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        with open(CACHE_PATH, 'w') as f:
+            json.dump(cache, f, indent=4)
+
+    config = override(config, {'train.batch_size': cache[key]['batch_size'],
+                               'train.accum_batches_num': cache[key]['accum_batches_num']})
+    print(f'tuned batch_size={config.train.batch_size} '
+          f'accum_batches_num={config.train.accum_batches_num}')
+    return config
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config', help='model configuration file (YAML)', type=str)
+    parser.add_argument('--num_steps', help='number of measured steps per batch size', type=int, default=5)
+    args = parser.parse_args()
+
+    config = load_config(args.config, 0)
+    tune_batch_size(config, args.num_steps)
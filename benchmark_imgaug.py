@@ -0,0 +1,47 @@
+#!/usr/bin/python3.6
+''' Compares speed of imgaug-backed transforms with their native replacements. '''
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+import albumentations as albu
+
+
+PAIRS = [
+    (albu.IAAAdditiveGaussianNoise(p=1), albu.AdditiveGaussianNoise(p=1)),
+    (albu.IAAPiecewiseAffine(p=1), albu.PiecewiseAffine(p=1)),
+    (albu.IAASharpen(p=1), albu.Sharpen(p=1)),
+    (albu.IAAEmboss(p=1), albu.Emboss(p=1)),
+]
+
+
+def measure(transform: albu.BasicTransform, images: np.ndarray) -> float:
+    ''' Returns milliseconds per image. '''
+    transform(image=images[0])
+    start = time.time()
+
+    for image in images:
+        transform(image=image)
+
+    return (time.time() - start) / len(images) * 1000
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input_size', help='image size', type=int, default=288)
+    parser.add_argument('--num_images', help='number of images', type=int, default=50)
+    args = parser.parse_args()
+
+    # smooth random images, so filters produce realistic values
+    size = args.input_size
+    images = [cv2.resize(np.random.randint(0, 256, (size // 8, size // 8, 3), dtype=np.uint8), (size, size))
+              for _ in range(args.num_images)]
+
+    for iaa_transform, native_transform in PAIRS:
+        iaa_time = measure(iaa_transform, images)
+        native_time = measure(native_transform, images)
+
+        print(f'{native_transform.__class__.__name__:24} imgaug {iaa_time:8.2f} ms, '
+              f'native {native_time:8.2f} ms, speedup {iaa_time / native_time:5.1f}x')
@@ -0,0 +1,44 @@
+#!/usr/bin/python3.6
+''' Compares two results of benchmarks/throughput.py and prints relative changes of throughput. '''
+
+import argparse
+import json
+
+from typing import Any, Dict, Iterator, Tuple
+
+
+def flatten(results: Dict[str, Any], prefix: str = '') -> Iterator[Tuple[str, float]]:
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f'{prefix}{key}.')
+        elif isinstance(value, (int, float)):
+            yield prefix + key, value
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('baseline', help='JSON with baseline results', type=str)
+    parser.add_argument('current', help='JSON with current results', type=str)
+    parser.add_argument('--threshold', help='relative change to highlight', type=float, default=0.05)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    env1, env2 = baseline['environment'], current['environment']
+    for key in sorted(env1.keys() | env2.keys()):
+        if key != 'timestamp' and env1.get(key) != env2.get(key):
+            print(f'environment differs: {key}: {env1.get(key)} -> {env2.get(key)}')
+
+    old = dict(flatten({'data': baseline['data'], **baseline['archs']}))
+    new = dict(flatten({'data': current['data'], **current['archs']}))
+
+    for name in sorted(old.keys() & new.keys()):
+        if old[name] == 0:
+            continue
+
+        change = new[name] / old[name] - 1
+        worse = change < 0 if name.endswith('images_per_sec') else change > 0
+        mark = ' <-- regression' if worse and abs(change) > args.threshold else ''
+        print(f'{name:50} {old[name]:10.2f} {new[name]:10.2f} {change:+8.1%}{mark}')
@@ -0,0 +1,243 @@
+#!/usr/bin/python3.6
+''' Measures training and inference throughput of every architecture on
+synthetic or cached images. Data loading, augmentation, forward, backward and
+optimizer step are timed separately. Results are written as JSON together with
+an environment fingerprint, so runs on different machines and commits can be
+compared with benchmarks/compare.py. Works on CPU with small iteration counts. '''
+
+import argparse
+import io
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+from glob import glob
+from typing import Any, Callable, Dict, List
+
+import cv2
+import numpy as np
+import pandas as pd
+import torch
+
+from PIL import Image
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+
+import train
+
+from data_loader import ImageDataset, DeviceNormalizer
+from losses import get_loss
+from model import create_model
+from model_provider import _models
+from optimizers import get_optimizer
+from parse_config import load_config, override
+from utils import create_logger
+
+
+def get_environment() -> Dict[str, Any]:
+    ''' Returns everything that affects throughput, besides the code. '''
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_PATH,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    cpu = platform.processor()
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo') as f:
+            names = [line.split(':', 1)[1].strip() for line in f if line.startswith('model name')]
+            cpu = names[0] if names else cpu
+
+    cuda = torch.cuda.is_available()
+
+    return {'hostname': socket.gethostname(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu': cpu,
+            'cpu_count': os.cpu_count(),
+            'torch_threads': torch.get_num_threads(),
+            'torch': torch.__version__,
+            'cuda': torch.version.cuda if cuda else None,
+            'cudnn': torch.backends.cudnn.version() if cuda else None,
+            'gpu': torch.cuda.get_device_name(0) if cuda else None,
+            'gpu_count': torch.cuda.device_count(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+def load_images(directory: str, num_images: int) -> List[bytes]:
+    ''' Returns PNG files from the directory, or synthetic PNGs of typical iMet sizes. '''
+    if directory:
+        paths = sorted(glob(os.path.join(directory, '*.png')))[:num_images]
+        assert paths, 'no images found in ' + directory
+
+        files = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                files.append(f.read())
+
+        return files
+
+    random_state = np.random.RandomState(0)
+    files = []
+
+    for _ in range(num_images):
+        height, width = 300, random_state.randint(300, 900)
+        if random_state.rand() < 0.5:
+            height, width = width, height
+
+        # smooth noise compresses like photos, unlike white noise
+        small = random_state.randint(0, 256, (height // 8, width // 8, 3)).astype(np.uint8)
+        image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+        files.append(cv2.imencode('.png', image)[1].tobytes())
+
+    return files
+
+def measure(func: Callable[[], Any], sync: bool) -> float:
+    ''' Returns time of the call in seconds. '''
+    if sync:
+        torch.cuda.synchronize()
+
+    start = time.time()
+    func()
+
+    if sync:
+        torch.cuda.synchronize()
+
+    return time.time() - start
+
+def benchmark_data(files: List[bytes], augmentor: Any, dataset: ImageDataset) -> Any:
+    ''' Returns timings per image in ms and the resulting tensors. '''
+    start = time.time()
+    images = [np.array(Image.open(io.BytesIO(data)).convert('RGB')) for data in files]
+    decode_time = time.time() - start
+
+    start = time.time()
+    images = [augmentor(image=image)['image'] for image in images]
+    augment_time = time.time() - start
+
+    start = time.time()
+    tensors = [dataset.to_tensor(image) for image in images]
+    to_tensor_time = time.time() - start
+
+    num_images = len(files)
+    timings = {'decode_ms': decode_time / num_images * 1000,
+               'augment_ms': augment_time / num_images * 1000,
+               'to_tensor_ms': to_tensor_time / num_images * 1000}
+    timings['images_per_sec'] = 1000 / sum(timings.values())
+    return timings, tensors
+
+def benchmark_arch(config: Any, batches: List[torch.Tensor], num_warmup: int) -> Dict[str, Any]:
+    ''' Runs train_epoch- and inference-like loops, returns timings per batch in ms. '''
+    cuda = torch.cuda.is_available()
+    device = torch.device('cuda' if cuda else 'cpu')
+    normalize = DeviceNormalizer(config)
+
+    model = create_model(config, pretrained=False).to(device)
+    criterion = get_loss(config)
+    optimizer = get_optimizer(config, model.parameters())
+    batch_size = batches[0].shape[0]
+    target = torch.zeros(batch_size, config.model.num_classes, device=device)
+    target[:, 0] = 1
+
+    stages: Dict[str, List[float]] = {'copy': [], 'forward': [], 'backward': [], 'optimizer': []}
+    model.train()
+
+    for i, batch in enumerate(batches):
+        box: Dict[str, Any] = {}
+
+        def copy() -> None:
+            box['input'] = normalize(batch).to(device)
+
+        def forward() -> None:
+            box['loss'] = criterion(model(box['input']), target)
+
+        def backward() -> None:
+            optimizer.zero_grad()
+            box['loss'].backward()
+
+        timings = {'copy': measure(copy, cuda),
+                   'forward': measure(forward, cuda),
+                   'backward': measure(backward, cuda),
+                   'optimizer': measure(optimizer.step, cuda)}
+
+        if i >= num_warmup:
+            for stage, elapsed in timings.items():
+                stages[stage].append(elapsed)
+
+    results = {'train': {stage + '_ms': np.mean(times) * 1000 for stage, times in stages.items()}}
+    results['train']['images_per_sec'] = batch_size / sum(np.mean(times) for times in stages.values())
+
+    inference_times = []
+    model.eval()
+
+    with torch.no_grad():
+        for i, batch in enumerate(batches):
+            elapsed = measure(lambda: model(normalize(batch).to(device)), cuda)
+            if i >= num_warmup:
+                inference_times.append(elapsed)
+
+    results['inference'] = {'forward_ms': np.mean(inference_times) * 1000,
+                            'images_per_sec': batch_size / np.mean(inference_times)}
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', help='model configuration file (YAML)', type=str,
+                        default=os.path.join(REPO_PATH, 'config/v5.3.0.seresnext50.yml'))
+    parser.add_argument('--archs', help='architectures, all by default', type=str, nargs='*')
+    parser.add_argument('--input_size', help='override input size', type=int, default=0)
+    parser.add_argument('--batch_size', help='batch size', type=int, default=4)
+    parser.add_argument('--num_steps', help='number of measured steps', type=int, default=3)
+    parser.add_argument('--num_warmup', help='number of steps to skip', type=int, default=1)
+    parser.add_argument('--images', help='directory with PNG images, synthetic images if empty', type=str, default='')
+    parser.add_argument('--output', help='JSON file with results, ../benchmarks/<time>_<host>.json by default', type=str)
+    args = parser.parse_args()
+
+    config = load_config(args.config, 0)
+    input_size = args.input_size or config.model.input_size
+    config = override(config, {'model.input_size': input_size})
+
+    train.config = config
+    train.logger = create_logger(None)
+    torch.backends.cudnn.benchmark = True # type: ignore
+
+    num_batches = args.num_warmup + args.num_steps
+    files = load_images(args.images, args.batch_size * num_batches)
+
+    dataset = ImageDataset(pd.DataFrame(), mode='train', config=config, input_size=input_size)
+    data_results, tensors = benchmark_data(files, train.get_train_transform(input_size), dataset)
+    print(f'data: {data_results}')
+
+    batches = [torch.stack(tensors[i : i + args.batch_size])
+               for i in range(0, len(tensors), args.batch_size)]
+
+    results: Dict[str, Any] = {}
+    for arch in args.archs or sorted(_models.keys()):
+        results[arch] = benchmark_arch(override(config, {'model.arch': arch}), batches, args.num_warmup)
+        print(f'{arch}: {results[arch]}')
+
+    report = {'environment': get_environment(),
+              'config': os.path.basename(args.config),
+              'input_size': input_size,
+              'batch_size': args.batch_size,
+              'num_steps': args.num_steps,
+              'images': args.images or 'synthetic',
+              'data': data_results,
+              'archs': results}
+
+    # results are kept outside of the repo, like other outputs in ../cache and ../models
+    output = args.output or os.path.join(os.path.dirname(REPO_PATH), 'benchmarks',
+                                         f'{time.strftime("%Y%m%d_%H%M%S")}_{socket.gethostname()}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    print(f'results were saved to {output}')
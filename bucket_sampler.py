@@ -0,0 +1,67 @@
+''' Batch sampler, which groups images of similar aspect ratio into batches. '''
+
+import random
+
+from typing import Iterator, List, Tuple
+
+import numpy as np
+import torch.utils.data
+
+
+def get_crop_shape(aspect_ratio: float, input_size: int, multiple: int = 32) -> Tuple[int, int]:
+    ''' Returns (height, width) with the given height / width ratio and about
+    the same number of pixels as input_size x input_size. '''
+    height = int(round(input_size * aspect_ratio ** 0.5 / multiple)) * multiple
+    width = int(round(input_size / aspect_ratio ** 0.5 / multiple)) * multiple
+    return max(height, multiple), max(width, multiple)
+
+class BucketBatchSampler(torch.utils.data.Sampler):
+    ''' Splits images into buckets by the nearest aspect ratio (in log scale) and
+    yields batches from a single bucket. Every element of a batch is a tuple
+    (index, (crop_height, crop_width)), so ImageDataset crops all images of
+    the batch to the shape of their bucket instead of padding them to a square. '''
+    def __init__(self, image_sizes: np.ndarray, batch_size: int, input_size: int,
+                 aspect_ratios: List[float], shuffle: bool = True,
+                 drop_last: bool = True) -> None:
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+        ratios = np.log(image_sizes[:, 0] / image_sizes[:, 1])
+        centers = np.log(np.array(aspect_ratios, dtype=np.float64))
+        bucket_ids = np.argmin(np.abs(ratios[:, None] - centers[None, :]), axis=1)
+
+        self.buckets = [np.nonzero(bucket_ids == i)[0].tolist() for i in range(len(centers))]
+        self.crop_shapes = [get_crop_shape(ratio, input_size) for ratio in aspect_ratios]
+
+    def _get_batches(self) -> List[List[Tuple[int, Tuple[int, int]]]]:
+        batches = []
+
+        for indices, crop_shape in zip(self.buckets, self.crop_shapes):
+            if self.shuffle:
+                indices = random.sample(indices, len(indices))
+
+            for start in range(0, len(indices), self.batch_size):
+                batch = indices[start : start + self.batch_size]
+
+                if len(batch) == self.batch_size or not self.drop_last:
+                    batches.append([(index, crop_shape) for index in batch])
+
+        if self.shuffle:
+            random.shuffle(batches)
+
+        return batches
+
+    def __iter__(self) -> Iterator[List[Tuple[int, Tuple[int, int]]]]:
+        return iter(self._get_batches())
+
+    def __len__(self) -> int:
+        if self.drop_last:
+            return sum(len(indices) // self.batch_size for indices in self.buckets)
+        else:
+            return sum((len(indices) + self.batch_size - 1) // self.batch_size
+                       for indices in self.buckets)
+
+    def summary(self) -> str:
+        return ', '.join(f'{h}x{w}: {len(indices)}' for indices, (h, w)
+                         in zip(self.buckets, self.crop_shapes))
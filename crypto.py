@@ -3,19 +3,25 @@
 
 import argparse
 import hashlib
+import io
 import os
 import struct
 
 from base64 import b32encode, b32decode
+from multiprocessing import Pool
+from typing import BinaryIO, List, Optional, Tuple
 from Crypto.Cipher import AES
 from debug import dprint
 
 password = 'JirOlm5knaw'
 key = hashlib.sha256(password.encode()).digest()
 
-IV = 16 * '\x00'           # Initialization vector: discussed later
+IV = 16 * b'\x00'           # Initialization vector: discussed later
 mode = AES.MODE_CBC
 
+CHUNK_SIZE = 1 << 24        # must be a multiple of AES.block_size
+HEADER = struct.Struct('<Q')
+
 
 def _pad(s: bytes) -> bytes:
     return s + (' ' * (AES.block_size - len(s) % AES.block_size)).encode()
@@ -42,41 +48,77 @@ def decrypt(ciphertext):
     plaintext = cipher.decrypt(ciphertext)
     return plaintext.rstrip(b"\0")
 
-def encrypt_file(file_name, out_name=None):
-    if out_name == None:
-        out_name = file_name + '.enc'
+def encrypt_stream(src: BinaryIO, dst: BinaryIO, file_size: int) -> None:
+    ''' Encrypts chunk by chunk. CBC state is carried over between chunks,
+    so the output is the same as of encrypt() on the whole file. '''
+    cipher = AES.new(key, mode, IV=IV)
+    dst.write(HEADER.pack(file_size))
 
-    with open(file_name, 'rb') as fo:
-        plaintext = fo.read()
+    while True:
+        chunk = src.read(CHUNK_SIZE)
+
+        if len(chunk) < CHUNK_SIZE:
+            dst.write(cipher.encrypt(_pad(chunk)))
+            break
+
+        dst.write(cipher.encrypt(chunk))
+
+def decrypt_stream(src: BinaryIO, dst: BinaryIO) -> None:
+    ''' Decrypts chunk by chunk, memory usage is bounded by CHUNK_SIZE. '''
+    cipher = AES.new(key, mode, IV=IV)
+    remaining = HEADER.unpack(src.read(HEADER.size))[0]
 
-    enc = encrypt(plaintext)
+    while remaining > 0:
+        chunk = src.read(CHUNK_SIZE)
+        if not chunk:
+            raise ValueError('encrypted file is truncated')
 
-    with open(out_name, 'wb') as fo:
-        filesize = os.path.getsize(file_name)
-        fo.write(struct.pack('<Q', filesize))
-        fo.write(enc)
+        plaintext = cipher.decrypt(chunk)
+        dst.write(plaintext[:remaining])
+        remaining -= len(plaintext)
 
-def decrypt_file(file_name, out_name=None):
+def encrypt_file(file_name: str, out_name: Optional[str] = None) -> None:
+    if out_name == None:
+        out_name = file_name + '.enc'
+
+    with open(file_name, 'rb') as src, open(out_name, 'wb') as dst:
+        encrypt_stream(src, dst, os.fstat(src.fileno()).st_size)
+
+def decrypt_file(file_name: str, out_name: Optional[str] = None) -> None:
     if out_name == None:
         assert file_name.endswith('.enc')
         out_name = file_name[:-4]
 
-    with open(file_name, 'rb') as fo:
-        origsize = struct.unpack('<Q', fo.read(struct.calcsize('Q')))[0]
-        ciphertext = fo.read()
+    with open(file_name, 'rb') as src, open(out_name, 'wb') as dst:
+        decrypt_stream(src, dst)
+
+def decrypt_to_buffer(file_name: str) -> io.BytesIO:
+    ''' Decrypts into memory, so plaintext never touches the disk.
+    The result can be passed to torch.load directly. '''
+    buffer = io.BytesIO()
+
+    with open(file_name, 'rb') as src:
+        decrypt_stream(src, buffer)
+
+    buffer.seek(0)
+    return buffer
 
-    dec = decrypt(ciphertext)
+def decrypt_files(pairs: List[Tuple[str, str]], num_processes: Optional[int] = None) -> None:
+    ''' Decrypts (file_name, out_name) pairs in parallel. '''
+    with Pool(num_processes) as pool:
+        pool.starmap(decrypt_file, pairs, chunksize=1)
 
-    with open(out_name, 'wb') as fo:
-        fo.write(dec)
-        fo.truncate(origsize)
+def encrypt_files(pairs: List[Tuple[str, str]], num_processes: Optional[int] = None) -> None:
+    with Pool(num_processes) as pool:
+        pool.starmap(encrypt_file, pairs, chunksize=1)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('filename', help='file to encode or decode', type=str)
+    parser.add_argument('filenames', help='files to encode or decode', type=str, nargs='+')
+    parser.add_argument('--num_processes', help='number of processes', type=int)
     args = parser.parse_args()
 
-    if not args.filename.endswith('.enc'):
-        encrypt_file(args.filename)
-    else:
-        decrypt_file(args.filename)
+    encrypt_files([(path, path + '.enc') for path in args.filenames
+                   if not path.endswith('.enc')], args.num_processes)
+    decrypt_files([(path, path[:-4]) for path in args.filenames
+                   if path.endswith('.enc')], args.num_processes)
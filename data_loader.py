@@ -4,6 +4,7 @@ import math
 import os
 import pickle
 import random
+import time
 
 from collections import defaultdict
 from glob import glob
@@ -13,18 +14,137 @@ import numpy as np
 import pandas as pd
 import torch
 import torch.utils.data
-import torchvision.transforms as transforms
 
 from PIL import Image
 
+import albumentations.augmentations.functional as albu_F
+
+from image_index import load_index
+from random_rect_crop import resize
+from telemetry import WorkerStats
+
 
 SAVE_DEBUG_IMAGES = False
 
 
+def get_mean_std(config: Any) -> Tuple[np.ndarray, np.ndarray]:
+    if 'ception' in config.model.arch:
+        return np.array([0.5, 0.5, 0.5]), np.array([0.5, 0.5, 0.5])
+    else:
+        return np.array([0.485, 0.456, 0.406]), np.array([0.229, 0.224, 0.225])
+
+class DeviceNormalizer:
+    ''' Normalizes batches of uint8 images on GPU, if data.normalize_on_device is set.
+    Otherwise, the data loader has normalized them already, and they're passed as is.
+    By default, images are moved to GPU if there is one; device overrides it. '''
+    def __init__(self, config: Any) -> None:
+        self.enabled = config.data.normalize_on_device
+        mean, std = get_mean_std(config)
+        self.scale = torch.tensor(1 / (255 * std), dtype=torch.float32).view(1, 3, 1, 1)
+        self.bias = torch.tensor(-mean / std, dtype=torch.float32).view(1, 3, 1, 1)
+
+    def __call__(self, images: torch.Tensor, device: Any = None) -> torch.Tensor:
+        if not self.enabled:
+            return images
+
+        assert images.dtype == torch.uint8, \
+            f'normalize_on_device expects uint8 images, got {images.dtype}'
+
+        if device is None and torch.cuda.is_available():
+            device = 'cuda'
+
+        if device is not None:
+            images = images.to(device, non_blocking=True)
+
+        if self.scale.device != images.device:
+            self.scale = self.scale.to(images.device)
+            self.bias = self.bias.to(images.device)
+
+        shape = images.shape
+        images = images.view(-1, *shape[-3:])   # fuse TTAs into batch
+        return torch.addcmul(self.bias, images.float(), self.scale).view(shape)
+
+class DevicePrefetcher:
+    ''' Wraps a DataLoader and copies the next batch to GPU on a side stream,
+    while the current batch is being processed. Images are normalized on the side
+    stream too. Batches are images or tuples (images, targets); if images_only is
+    set, targets stay on the host. Without CUDA, batches are only normalized. '''
+    def __init__(self, loader: Any, normalize: Optional[DeviceNormalizer] = None,
+                 device: Optional[str] = None, images_only: bool = False,
+                 telemetry: Any = None) -> None:
+        self.loader = loader
+        self.normalize = normalize
+        self.images_only = images_only
+        self.telemetry = telemetry
+
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+
+        self.device = torch.device(device)
+        self.stream = torch.cuda.Stream() if self.device.type == 'cuda' else None
+
+    @property
+    def dataset(self) -> Any:
+        return self.loader.dataset
+
+    def __len__(self) -> int:
+        return len(self.loader)
+
+    def _prepare(self, batch: Any) -> Any:
+        images, rest = (batch[0], batch[1:]) if isinstance(batch, (tuple, list)) else (batch, None)
+
+        if self.telemetry:
+            self.telemetry.copy_started()
+
+        if self.stream is not None:
+            images = images.to(self.device, non_blocking=True)
+
+            if rest is not None and not self.images_only:
+                rest = [t.to(self.device, non_blocking=True) for t in rest]
+
+        if self.normalize is not None:
+            images = self.normalize(images, self.device)
+
+        if self.telemetry:
+            self.telemetry.copy_finished()
+
+        return images if rest is None else (images, *rest)
+
+    def __iter__(self) -> Iterator[Any]:
+        if self.stream is None:
+            yield from map(self._prepare, self.loader)
+            return
+
+        current_stream = torch.cuda.current_stream()
+        iterator = iter(self.loader)
+
+        def preload() -> Any:
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return None
+
+            with torch.cuda.stream(self.stream):
+                return self._prepare(batch)
+
+        next_batch = preload()
+
+        while next_batch is not None:
+            current_stream.wait_stream(self.stream)
+            batch = next_batch
+
+            # the caching allocator must not reuse these tensors, while they're used by the main stream
+            for tensor in batch if isinstance(batch, tuple) else (batch,):
+                if tensor.is_cuda:
+                    tensor.record_stream(current_stream)
+
+            next_batch = preload()
+            yield batch
+
 class ImageDataset(torch.utils.data.Dataset):
     def __init__(self, dataframe: pd.DataFrame, mode: str, config: Any,
                  num_ttas: int = 1, augmentor: Any = None,
-                 aug_type: str = 'albu') -> None:
+                 aug_type: str = 'albu', input_size: Optional[int] = None) -> None:
         print(f'creating data_loader for {config.version} in mode={mode}')
         assert mode in ['train', 'val', 'test']
 
@@ -36,24 +156,20 @@ class ImageDataset(torch.utils.data.Dataset):
         self.version = config.version
         self.path = config.data.train_dir if mode != 'test' else config.data.test_dir
         self.num_classes = config.model.num_classes
-        self.input_size = config.model.input_size
+        self.input_size = input_size or config.model.input_size
         self.rect_crop = config.data.rect_crop
         self.num_ttas = num_ttas
 
-        if 'ception' in config.model.arch:
-            self.transforms = transforms.Compose([
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.5, 0.5, 0.5],
-                                      std=[0.5, 0.5, 0.5])
-            ])
-        else:
-            self.transforms = transforms.Compose([
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                                      std=[0.229, 0.224, 0.225]),
-            ])
+        self.normalize_on_device = config.data.normalize_on_device
+        self.worker_stats: Optional[WorkerStats] = None
+        mean, std = get_mean_std(config)
+
+        # normalization is fused into a single multiply-add per channel
+        self.scale = (1 / (255 * std)).astype(np.float32).reshape(-1, 1, 1)
+        self.bias = (-mean / std).astype(np.float32).reshape(-1, 1, 1)
 
-    def _transform_image(self, image: Image, index: int) -> torch.Tensor:
+    def _transform_image(self, image: Image, index: int,
+                         crop_shape: Optional[Tuple[int, int]] = None) -> torch.Tensor:
         image = np.array(image)
 
         if self.rect_crop.enable:
@@ -83,7 +199,13 @@ class ImageDataset(torch.utils.data.Dataset):
             # print(f'dims were {dims[0]}x{dims[1]}, crop {crop_size[0]}' +
             #       f'x{crop_size[1]}, scaled into {new_size[0]}x{new_size[1]}')
 
-            image = np.array(Image.fromarray(image).resize(new_size, Image.BICUBIC))
+            image = resize(image, new_size[0], new_size[1])
+
+        if crop_shape is not None:
+            # bucketed batches: the augmentor doesn't crop, every bucket has its own shape
+            height, width = crop_shape
+            image = albu_F.pad(image, height, width)
+            image = albu_F.random_crop(image, height, width, random.random(), random.random())
 
         if self.augmentor is not None:
             if self.aug_type == 'albu':
@@ -95,16 +217,45 @@ class ImageDataset(torch.utils.data.Dataset):
             os.makedirs(f'../debug_images_{self.version}/', exist_ok=True)
             Image.fromarray(image).save(f'../debug_images_{self.version}/{index}.png')
 
-        return self.transforms(image)
+        return self.to_tensor(image)
+
+    def to_tensor(self, image: np.ndarray) -> torch.Tensor:
+        ''' Converts HWC uint8 image into CHW tensor. It's either normalized here in one
+        pass, or shipped as uint8 to be normalized on GPU. '''
+        if self.normalize_on_device:
+            return torch.from_numpy(np.ascontiguousarray(image.transpose(2, 0, 1)))
+
+        res = np.empty((image.shape[2], image.shape[0], image.shape[1]), dtype=np.float32)
+        np.multiply(image.transpose(2, 0, 1), self.scale, out=res)
+        res += self.bias
+        return torch.from_numpy(res)
+
+    def enable_telemetry(self, max_workers: int) -> None:
+        ''' Makes workers report decode and augmentation time. '''
+        self.worker_stats = WorkerStats(max_workers)
+
+    def get_image_sizes(self) -> np.ndarray:
+        ''' Returns heights and widths of images from the metadata index, without decoding them. '''
+        index = load_index(self.path).set_index('id')
+        return index.loc[self.df.iloc[:, 0].values, ['height', 'width']].values
 
     def __getitem__(self, index: int) -> Any:
         ''' Returns: tuple (sample, target) '''
+        crop_shape = None
+        if isinstance(index, tuple):    # from BucketBatchSampler
+            index, crop_shape = index
+
+        start = time.time()
         filename = self.df.iloc[index, 0]
         image = Image.open(os.path.join(self.path, filename + '.png'))
         assert image.mode == 'RGB'
 
+        if self.worker_stats is not None:
+            image.load()    # PIL decodes lazily
+            decoded = time.time()
+
         if self.num_ttas == 1:
-            image = self._transform_image(image, index)
+            image = self._transform_image(image, index, crop_shape)
         else:
             crops = [self._transform_image(image, index) for _ in range(self.num_ttas)]
 
@@ -114,6 +265,9 @@ class ImageDataset(torch.utils.data.Dataset):
 
             image = torch.stack(crops)
 
+        if self.worker_stats is not None:
+            self.worker_stats.update(decoded - start, time.time() - decoded)
+
         if self.mode != 'test':
             targets = np.zeros(self.num_classes, dtype=np.float32)
             labels = list(map(int, self.df.iloc[index, 1].split()))
@@ -1,23 +1,50 @@
 #!/usr/bin/python3.6
 
 import base64
-import gzip
+import hashlib
+import lzma
 import os
+import pprint
 import re
 import sys
+import time
 import yaml
 
 from pathlib import Path
 from glob import glob
+from typing import Dict, List, Tuple
 from debug import dprint
 
+MODULES_ZIP = 'modules.zip'     # must match script_template.py
 
-def encode_file(path: str) -> str:
+
+def read_file(path: str) -> bytes:
     if path == 'easydict.py':   # I need this hack to fool mypy linter
         path = 'easydict__.py'
 
-    compressed = gzip.compress(Path(path).read_bytes(), compresslevel=9)
-    return base64.b64encode(compressed).decode('utf-8')
+    return Path(path).read_bytes()
+
+def build_bundle(paths: List[str]) -> Tuple[str, Dict[str, List]]:
+    ''' Packs files into one solid LZMA stream of unique contents, encoded with
+    base85. Returns the encoded bundle and the index {path: [sha1, offset, size]}. '''
+    blobs: List[bytes] = []
+    offsets: Dict[str, int] = {}
+    index: Dict[str, List] = {}
+    total_size = 0
+
+    for path in dict.fromkeys(paths):   # removes duplicate paths, keeps the order
+        data = read_file(path)
+        digest = hashlib.sha1(data).hexdigest()
+
+        if digest not in offsets:
+            offsets[digest] = total_size
+            blobs.append(data)
+            total_size += len(data)
+
+        index[path] = [digest, offsets[digest], len(data)]
+
+    compressed = lzma.compress(b''.join(blobs), preset=9 | lzma.PRESET_EXTREME)
+    return base64.b85encode(compressed).decode('ascii'), index
 
 if __name__ == '__main__':
     if len(sys.argv) < 2 or not sys.argv[1].endswith('.py'):
@@ -27,22 +54,30 @@ if __name__ == '__main__':
     script_py = sys.argv[1]
 
     to_encode = [
+        'batch_tuner.py',
+        'bucket_sampler.py',
         'cosine_scheduler.py',
         'crypto.py',
         'data_loader.py',
         'debug.py',
         'easydict.py',
+        'ema.py',
         'folds.npy',
+        'image_index.py',
+        'import_time.py',
+        'loader_factory.py',
         'losses.py',
         'metrics.py',
         'model_provider.py',
         'model.py',
         'optimizers.py',
         'parse_config.py',
+        'quantization.py',
         'random_erase.py',
         'random_rect_crop.py',
         'schedulers.py',
         'senet.py',
+        'telemetry.py',
         'train.py',
         'utils.py',
 
@@ -75,13 +110,18 @@ if __name__ == '__main__':
 
     # print('encoding files', to_encode)
 
-    file_data = {path: encode_file(path) for path in to_encode}
-    printed_data = ',\n'.join([f'"{filename}": "{content}"' for filename, content in
-                              file_data.items()])
+    start = time.time()
+    bundle, index = build_bundle(to_encode)
+    raw_size = sum(size for _, _, size in index.values())
+    unique_size = sum({digest: size for digest, _, size in index.values()}.values())
+
+    print(f'bundled {len(index)} files in {time.time() - start:.2f} s: {raw_size} bytes, '
+          f'{unique_size} unique, {len(bundle)} encoded')
 
     with open('script_template.py') as f:
         template = f.read()
-        template = template.replace('{file_data}', '{' + printed_data + '}')
+        template = template.replace('{file_index}', pprint.pformat(index, width=120))
+        template = template.replace('{bundle}', bundle)
 
     cmd_line = ' '.join(sys.argv[1:])
     dest_name = re.sub(r'[/ .]', '_', cmd_line)
@@ -89,4 +129,5 @@ if __name__ == '__main__':
 
     with open(dest_name, 'w') as f:
         f.write(template)
-        f.write('\nos.system(\'export PYTHONPATH=${PYTHONPATH}:/kaggle/working && python ' + cmd_line + '\')\n\n')
+        f.write('\nos.system(\'export PYTHONPATH=${PYTHONPATH}:/kaggle/working:/kaggle/working/' +
+                MODULES_ZIP + ' && python ' + cmd_line + '\')\n\n')
@@ -0,0 +1,74 @@
+''' Exponential moving average of model weights, which is updated during training. '''
+
+import copy
+
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import torch
+import torch.nn as nn
+
+
+class ModelEMA:
+    ''' Keeps a shadow copy of the model: ema = decay * ema + (1 - decay) * weights.
+    BatchNorm statistics are averaged too, so the shadow model needs no BN update
+    pass like SWA does. The shadow may be kept on CPU to save GPU memory; then it's
+    updated every update_every steps, and decay is adjusted to keep the same horizon. '''
+    def __init__(self, model: nn.Module, decay: float, update_every: int = 1,
+                 device: Optional[str] = None) -> None:
+        self.decay = decay ** update_every
+        self.update_every = update_every
+        self.num_steps = 0
+        self.num_updates = 0
+
+        self.module = copy.deepcopy(model)
+        if device is not None:
+            self.module.to(device)
+
+        self.module.eval()
+        for param in self.module.parameters():
+            param.requires_grad_(False)
+
+    def step(self, model: nn.Module) -> None:
+        ''' Call it after every optimizer step. '''
+        self.num_steps += 1
+        if self.num_steps % self.update_every == 0:
+            self.update(model)
+
+    def update(self, model: nn.Module) -> None:
+        self.num_updates += 1
+        # early averages are dominated by random init, so decay is lower at the beginning
+        decay = min(self.decay, (1 + self.num_updates) / (10 + self.num_updates))
+
+        with torch.no_grad():
+            weights = model.state_dict()
+
+            for name, ema in self.module.state_dict().items():
+                value = weights[name].to(ema.device)
+
+                if ema.dtype.is_floating_point:
+                    ema.mul_(decay).add_(value, alpha=1 - decay)
+                else:
+                    ema.copy_(value)    # e.g. num_batches_tracked of BatchNorm
+
+    @contextmanager
+    def swapped(self, model: nn.Module) -> Iterator[nn.Module]:
+        ''' Temporarily loads averaged weights into the model, e.g. for validation.
+        It doesn't need a second copy of the model on GPU. '''
+        backup = {name: value.detach().cpu().clone() for name, value in model.state_dict().items()}
+        model.load_state_dict(self.module.state_dict())
+
+        try:
+            yield model
+        finally:
+            model.load_state_dict(backup)
+
+    def state_dict(self) -> Dict[str, Any]:
+        return {'state_dict': self.module.state_dict(),
+                'num_steps': self.num_steps,
+                'num_updates': self.num_updates}
+
+    def load_state_dict(self, state: Dict[str, Any]) -> None:
+        self.module.load_state_dict(state['state_dict'])
+        self.num_steps = state['num_steps']
+        self.num_updates = state['num_updates']
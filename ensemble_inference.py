@@ -7,11 +7,12 @@ import yaml
 
 from glob import glob
 from typing import List
-from crypto import decrypt_file
+from crypto import decrypt_files
 
 IN_KERNEL = os.environ.get('KAGGLE_WORKING_DIR') is not None
 MODEL_PATH = '../input/' if IN_KERNEL else '../best_models/'
 UNPACK_PATH = 'unpacked_models'
+DECRYPT_IN_MEMORY = True    # train.py decrypts .enc weights without writing them to disk
 
 
 def run(command: List[str]) -> None:
@@ -49,13 +50,17 @@ if __name__ == '__main__':
             assert m
             all_models.add(m.group(1) + '.pth')
 
-    for path in glob(MODEL_PATH + '**/*.enc'):
-        if os.path.basename(path)[:-4] in all_models:
-            os.makedirs(UNPACK_PATH, exist_ok=True)
-            out_path = os.path.join(UNPACK_PATH, os.path.basename(path)[:-4])
-            decrypt_file(path, out_path)
+    encrypted = {os.path.basename(path)[:-4]: path for path in glob(MODEL_PATH + '**/*.enc')
+                 if os.path.basename(path)[:-4] in all_models}
 
-    model2path = {os.path.basename(path): path for path in glob(MODEL_PATH + '**/*.pth')}
+    if DECRYPT_IN_MEMORY:
+        model2path = encrypted
+    else:
+        os.makedirs(UNPACK_PATH, exist_ok=True)
+        decrypt_files([(path, os.path.join(UNPACK_PATH, name)) for name, path in encrypted.items()])
+        model2path = {}
+
+    model2path.update({os.path.basename(path): path for path in glob(MODEL_PATH + '**/*.pth')})
     model2path.update({os.path.basename(path): path for path in glob(UNPACK_PATH + '**/*.pth')})
 
     print('models found', model2path.keys())
@@ -34,7 +34,8 @@ import albumentations as albu
 from utils import create_logger, AverageMeter
 from debug import dprint
 
-from parse_config import load_config
+from parse_config import load_config, override
+from loader_factory import create_loader, setup_sharing_strategy
 from losses import get_loss
 from schedulers import get_scheduler, is_scheduler_continuous, get_warmup_scheduler
 from optimizers import get_optimizer, get_lr, set_lr
@@ -69,11 +70,11 @@ def parse_labels(s: str) -> np.array:
     return res
 
 def load_data(fold: int) -> Any:
-    torch.multiprocessing.set_sharing_strategy('file_system') # type: ignore
+    setup_sharing_strategy()
     cudnn.benchmark = True # type: ignore
 
     logger.info('config:')
-    logger.info(pprint.pformat(config))
+    logger.info(pprint.pformat(config._asdict()))
 
     fold_num = np.load('folds.npy')
     train_df = pd.read_csv(INPUT_PATH + 'train.csv')
@@ -132,13 +133,11 @@ def load_data(fold: int) -> Any:
     train_dataset = TensorDataset(x_train, y_train)
     val_dataset = TensorDataset(x_val, y_val)
 
-    train_loader = torch.utils.data.DataLoader(
-        train_dataset, batch_size=config.train.batch_size, shuffle=True,
-        num_workers=config.num_workers, drop_last=True)
-
-    val_loader = torch.utils.data.DataLoader(
-        val_dataset, batch_size=config.train.batch_size, shuffle=False,
-        num_workers=config.num_workers)
+    # the data is already in memory, so workers would only add IPC overhead
+    config_ = override(config, {'num_workers': 0})
+    train_loader = create_loader(train_dataset, config_, batch_size=config.train.batch_size,
+                                 shuffle=True, drop_last=True)
+    val_loader = create_loader(val_dataset, config_, batch_size=config.train.batch_size)
 
     return train_loader, val_loader, None
 
@@ -612,10 +611,10 @@ if __name__ == '__main__':
     config = load_config(args.config, args.fold)
 
     if args.num_epochs:
-        config.train.num_epochs = args.num_epochs
+        config = override(config, {'train.num_epochs': args.num_epochs})
 
     if args.num_ttas:
-        config.test.num_ttas = args.num_ttas
+        config = override(config, {'test.num_ttas': args.num_ttas})
         # config.test.batch_size //= args.num_ttas # ideally, I'd like to use big batches
 
     if not os.path.exists(config.experiment_dir):
@@ -0,0 +1,83 @@
+#!/usr/bin/python3.6
+''' Image metadata index: sizes, modes and file sizes, read from PNG headers only. '''
+
+import os
+import struct
+import sys
+
+from glob import glob
+from multiprocessing.pool import ThreadPool
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from PIL import Image
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_MODES = {0: 'L', 2: 'RGB', 3: 'P', 4: 'LA', 6: 'RGBA'}
+COLUMNS = ['id', 'width', 'height', 'mode', 'file_size']
+
+
+def read_header(path: str) -> Tuple[int, int, str, int]:
+    ''' Returns width, height, mode and file size. Only the IHDR chunk is read for PNG. '''
+    with open(path, 'rb') as f:
+        header = f.read(26)
+        file_size = os.fstat(f.fileno()).st_size
+
+    if header[:8] == PNG_SIGNATURE and header[12:16] == b'IHDR':
+        width, height, bit_depth, color_type = struct.unpack('>IIBB', header[16:26])
+        mode = PNG_MODES.get(color_type, 'unknown')
+        if bit_depth == 16:
+            mode += ';16'
+
+        return width, height, mode, file_size
+
+    with Image.open(path) as image:  # PIL reads only the header here, too
+        return image.width, image.height, image.mode, file_size
+
+def get_index_path(directory: str) -> str:
+    ''' The index lives next to the CSVs, i.e. in the parent directory of images. '''
+    directory = os.path.normpath(directory)
+    return os.path.join(os.path.dirname(directory), os.path.basename(directory) + '_meta.npz')
+
+def build_index(directory: str, num_threads: int = 16) -> pd.DataFrame:
+    paths = sorted(glob(os.path.join(directory, '*.png')))
+
+    with ThreadPool(num_threads) as pool:
+        headers = pool.map(read_header, paths, chunksize=256)
+
+    df = pd.DataFrame(headers, columns=COLUMNS[1:])
+    df.insert(0, 'id', [os.path.splitext(os.path.basename(path))[0] for path in paths])
+    return df
+
+def save_index(df: pd.DataFrame, path: str) -> None:
+    np.savez(path, **{column: np.asarray(df[column], dtype=str if column in ['id', 'mode'] else np.int64)
+                      for column in COLUMNS})
+
+def load_index(directory: str) -> pd.DataFrame:
+    ''' Loads the index of images in the directory, builds it if it's missing or stale. '''
+    path = get_index_path(directory)
+
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(directory):
+        with np.load(path) as data:
+            return pd.DataFrame({column: data[column] for column in COLUMNS})
+
+    df = build_index(directory)
+
+    try:
+        save_index(df, path)
+    except OSError:  # read-only input, e.g. in Kaggle kernels
+        pass
+
+    return df
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(f'usage: {sys.argv[0]} <directory with images>')
+        sys.exit()
+
+    df = load_index(sys.argv[1])
+    print(f'{df.shape[0]} images indexed in {get_index_path(sys.argv[1])}')
+    print(df.describe())
@@ -0,0 +1,88 @@
+#!/usr/bin/python3.6
+''' Reports import time of a module and everything it imports, per module and
+cumulative, like python -X importtime, which is not available in Python 3.6.
+Exits with an error if the total time exceeds the budget. '''
+
+import argparse
+import builtins
+import sys
+import time
+
+from typing import Any, List, Tuple
+
+
+class ImportTimer:
+    ''' Wraps builtins.__import__ and times every import, which loads new modules. '''
+    def __init__(self) -> None:
+        self.original_import = builtins.__import__
+        self.records: List[Tuple[str, float, float, int]] = []  # name, self, cumulative, depth
+        self.children_time = [0.0]
+
+    def __enter__(self) -> 'ImportTimer':
+        builtins.__import__ = self
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        builtins.__import__ = self.original_import
+
+    def __call__(self, name: str, globals: Any = None, locals: Any = None,
+                 fromlist: Any = (), level: int = 0) -> Any:
+        num_modules = len(sys.modules)
+        self.children_time.append(0.0)
+        start = time.perf_counter()
+
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = time.perf_counter() - start
+            children = self.children_time.pop()
+
+            if len(sys.modules) != num_modules:
+                depth = len(self.children_time) - 1
+                self.records.append((self._resolve(name, globals, fromlist, level),
+                                     cumulative - children, cumulative, depth))
+                self.children_time[-1] += cumulative
+
+    @staticmethod
+    def _resolve(name: str, globals: Any, fromlist: Any, level: int) -> str:
+        if level > 0 and globals:
+            package = globals.get('__package__') or ''
+            base = package.rsplit('.', level - 1)[0]
+            name = f'{base}.{name}' if name else base
+
+        if fromlist:
+            names = ', '.join(fromlist[:3]) + (', ...' if len(fromlist) > 3 else '')
+            name = f'{name} ({names})'
+
+        return name
+
+    def report(self, top: int) -> str:
+        lines = [f'{"self, ms":>10} {"cumul, ms":>10}  module']
+        records = sorted(self.records, key=lambda record: -record[2])[:top]
+
+        for name, self_time, cumulative, depth in records:
+            lines.append(f'{self_time * 1000:10.1f} {cumulative * 1000:10.1f}  {"  " * depth}{name}')
+
+        return '\n'.join(lines)
+
+    def total(self) -> float:
+        return sum(cumulative for _, _, cumulative, depth in self.records if depth == 0)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('module', help='module to import, e.g. train', type=str)
+    parser.add_argument('--top', help='number of slowest modules to show', type=int, default=30)
+    parser.add_argument('--budget', help='maximum import time, seconds', type=float)
+    args = parser.parse_args()
+
+    sys.path.insert(0, '.')
+
+    with ImportTimer() as timer:
+        __import__(args.module)
+
+    print(timer.report(args.top))
+    print(f'total import time of {args.module}: {timer.total():.3f} s')
+
+    if args.budget is not None and timer.total() > args.budget:
+        print(f'import time exceeds the budget of {args.budget:.3f} s')
+        sys.exit(1)
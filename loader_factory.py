@@ -0,0 +1,125 @@
+''' Creates DataLoaders with the same settings for every script: pinned memory,
+persistent workers, prefetching and the number of workers chosen by measured throughput. '''
+
+import json
+import os
+import resource
+import time
+
+from typing import Any, Dict, List, Optional
+
+import torch
+import torch.utils.data
+
+from parse_config import get_cpu_count
+
+CACHE_PATH = '../cache/loader_tuner.json'
+
+
+def setup_sharing_strategy() -> None:
+    ''' Workers pass tensors through file descriptors. Unlike the file_system strategy,
+    it doesn't leave files in /dev/shm when a process is killed, but it needs a bigger
+    limit of open files, so the soft limit is raised to the hard one. '''
+    torch.multiprocessing.set_sharing_strategy('file_descriptor') # type: ignore
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            print(f'could not raise the limit of open files, it is {soft}')
+
+def get_cache_key(config: Any, dataset: Any, batch_size: Optional[int]) -> str:
+    input_size = getattr(dataset, 'input_size', config.model.input_size)
+    return f'cpu{get_cpu_count()}_{config.version}_{getattr(dataset, "mode", "")}_' \
+           f'{input_size}_{batch_size}'
+
+def get_candidates(max_workers: int) -> List[int]:
+    candidates, num_workers = [], 2
+
+    while num_workers < max_workers:
+        candidates.append(num_workers)
+        num_workers *= 2
+
+    return candidates + [max_workers]
+
+def measure(loader_args: Dict[str, Any], num_workers: int, num_batches: int) -> float:
+    ''' Returns batches/sec of the loader, excluding the startup of workers. '''
+    loader = torch.utils.data.DataLoader(**loader_args, num_workers=num_workers)
+    iterator = iter(loader)
+    next(iterator)  # the first batch is a warmup
+    start, count = time.time(), 0
+
+    for _ in iterator:
+        count += 1
+        if count >= num_batches:
+            break
+
+    return count / (time.time() - start)
+
+def tune_num_workers(loader_args: Dict[str, Any], config: Any, num_batches: int = 30) -> int:
+    ''' Returns the smallest number of workers which gives 95% of the best throughput. '''
+    key = get_cache_key(config, loader_args['dataset'], loader_args.get('batch_size'))
+    cache: Dict[str, Any] = {}
+
+    if os.path.exists(CACHE_PATH):
+        with open(CACHE_PATH) as f:
+            cache = json.load(f)
+
+    if key not in cache:
+        results: Dict[int, float] = {}
+
+        for num_workers in get_candidates(config.num_workers):
+            results[num_workers] = measure(loader_args, num_workers, num_batches)
+            print(f'workers {num_workers}: {results[num_workers]:.2f} batches/sec')
+
+        best = max(results.values())
+        cache[key] = {'num_workers': min(n for n, speed in results.items() if speed >= best * 0.95),
+                      'probes': {str(n): speed for n, speed in results.items()}}
+
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        with open(CACHE_PATH, 'w') as f:
+            json.dump(cache, f, indent=4)
+
+    print(f'tuned num_workers={cache[key]["num_workers"]}')
+    return cache[key]['num_workers']
+
+def create_loader(dataset: Any, config: Any, batch_size: Optional[int] = None,
+                  shuffle: bool = False, drop_last: bool = False,
+                  batch_sampler: Any = None, tune: bool = False,
+                  persistent: bool = False) -> Any:
+    ''' Creates a DataLoader. If tune is set and config.loader.auto_workers is
+    enabled, the number of workers is measured once and cached.
+
+    If persistent is set and config.loader.persistent_workers is enabled, workers
+    survive between epochs. Their process state survives too: changes of dataset
+    attributes after the first epoch don't reach them, and per-process statistics
+    (the augmentation profiler) have to be reset through their own mechanisms.
+    A rebuilt loader must shut down the old one with shutdown_loader(). '''
+    if batch_sampler is not None:
+        loader_args = {'dataset': dataset, 'batch_sampler': batch_sampler}
+    else:
+        loader_args = {'dataset': dataset, 'batch_size': batch_size,
+                       'shuffle': shuffle, 'drop_last': drop_last}
+
+    loader_args['pin_memory'] = config.loader.pin_memory and torch.cuda.is_available()
+    num_workers = config.num_workers
+
+    if tune and config.loader.auto_workers and num_workers > 2:
+        num_workers = tune_num_workers(loader_args, config)
+
+    if num_workers > 0:
+        loader_args['persistent_workers'] = persistent and config.loader.persistent_workers
+        loader_args['prefetch_factor'] = config.loader.prefetch_factor
+
+    return torch.utils.data.DataLoader(**loader_args, num_workers=num_workers)
+
+def shutdown_loader(loader: Any) -> None:
+    ''' Stops persistent workers now rather than when the loader is garbage
+    collected, so two pools don't coexist after the loader is replaced. '''
+    iterator = getattr(loader, '_iterator', None)
+
+    if iterator is not None and hasattr(iterator, '_shutdown_workers'):
+        iterator._shutdown_workers()
+
+    loader._iterator = None
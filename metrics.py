@@ -3,13 +3,9 @@
 import torch
 from debug import dprint
 
-def F_score(predict: torch.Tensor, labels: torch.Tensor, beta: int,
-            threshold: float = 0.5) -> float:
-    if not isinstance(predict, torch.Tensor):
-        predict = torch.tensor(predict)
-    if not isinstance(labels, torch.Tensor):
-        labels = torch.tensor(labels)
-
+def F_score_per_sample(predict: torch.Tensor, labels: torch.Tensor, beta: int,
+                       threshold: float = 0.5) -> torch.Tensor:
+    ''' Returns F-score for every sample. Stays on the device of the inputs. '''
     if predict.shape != labels.shape:
         dprint(predict.shape)
         dprint(labels.shape)
@@ -19,14 +15,21 @@ def F_score(predict: torch.Tensor, labels: torch.Tensor, beta: int,
     labels = labels > threshold
 
     TP = (predict & labels).sum(1).float()
-    TN = ((~predict) & (~labels)).sum(1).float()
     FP = (predict & (~labels)).sum(1).float()
     FN = ((~predict) & labels).sum(1).float()
 
     precision = TP / (TP + FP + 1e-12)
     recall = TP / (TP + FN + 1e-12)
-    F2 = (1 + beta**2) * precision * recall / (beta**2 * precision + recall + 1e-12)
-    return F2.mean(0).item()
+    return (1 + beta**2) * precision * recall / (beta**2 * precision + recall + 1e-12)
+
+def F_score(predict: torch.Tensor, labels: torch.Tensor, beta: int,
+            threshold: float = 0.5) -> float:
+    if not isinstance(predict, torch.Tensor):
+        predict = torch.tensor(predict)
+    if not isinstance(labels, torch.Tensor):
+        labels = torch.tensor(labels)
+
+    return F_score_per_sample(predict, labels, beta, threshold).mean(0).item()
 
 def GAP(predicts: torch.Tensor, confs: torch.Tensor, targets: torch.Tensor) -> float:
     ''' Computes GAP@1 '''
@@ -0,0 +1,285 @@
+"""
+    Inference-mode graph rewrites: Batch normalization folding and fused SE blocks.
+"""
+
+__all__ = ['fuse_conv_bn', 'FusedConvBlock', 'FusedSEBlock', 'fuse_model', 'check_fused_model']
+
+import copy
+import time
+import torch
+import torch.nn as nn
+from .common import Identity
+
+
+def fuse_conv_bn(conv,
+                 bn):
+    """
+    Fold Batch normalization into the weights of the preceding convolution.
+
+    Parameters:
+    ----------
+    conv : nn.Conv2d
+        Convolution layer.
+    bn : nn.BatchNorm2d
+        Batch normalization layer, which follows the convolution.
+
+    Returns
+    -------
+    nn.Conv2d
+        Convolution layer with bias.
+    """
+    fused = nn.Conv2d(
+        in_channels=conv.in_channels,
+        out_channels=conv.out_channels,
+        kernel_size=conv.kernel_size,
+        stride=conv.stride,
+        padding=conv.padding,
+        dilation=conv.dilation,
+        groups=conv.groups,
+        bias=True).to(conv.weight.device)
+
+    with torch.no_grad():
+        std = torch.sqrt(bn.running_var + bn.eps)
+        scale = bn.weight / std if bn.affine else 1.0 / std
+        shift = bn.bias if bn.affine else torch.zeros_like(std)
+
+        fused.weight.copy_(conv.weight * scale.view(-1, 1, 1, 1))
+        bias = conv.bias if conv.bias is not None else torch.zeros_like(std)
+        fused.bias.copy_((bias - bn.running_mean) * scale + shift)
+
+    return fused
+
+
+class FusedConvBlock(nn.Module):
+    """
+    Convolution block with folded Batch normalization and optional activation.
+
+    Parameters:
+    ----------
+    conv : nn.Conv2d
+        Convolution layer with folded Batch normalization.
+    activ : nn.Module or None
+        Activation function.
+    """
+    def __init__(self,
+                 conv,
+                 activ=None):
+        super(FusedConvBlock, self).__init__()
+        self.conv = conv
+        self.activ = activ
+        self.relu = isinstance(activ, nn.ReLU)
+
+    def forward(self, x):
+        x = self.conv(x)
+        if self.relu:
+            x = torch.relu_(x)
+        elif self.activ is not None:
+            x = self.activ(x)
+        return x
+
+
+class FusedSEBlock(nn.Module):
+    """
+    Squeeze-and-Excitation block, where pooling is a mean reduction and 1x1 convolutions are linear layers.
+
+    Parameters:
+    ----------
+    se : SEBlock
+        Original block.
+    """
+    def __init__(self,
+                 se):
+        super(FusedSEBlock, self).__init__()
+        self.fc1 = self._to_linear(se.conv1)
+        self.fc2 = self._to_linear(se.conv2)
+
+    @staticmethod
+    def _to_linear(conv):
+        linear = nn.Linear(
+            in_features=conv.in_channels,
+            out_features=conv.out_channels).to(conv.weight.device)
+
+        with torch.no_grad():
+            linear.weight.copy_(conv.weight.view(conv.out_channels, conv.in_channels))
+            linear.bias.copy_(conv.bias)
+
+        return linear
+
+    def forward(self, x):
+        w = x.mean(dim=(2, 3))
+        w = torch.relu_(self.fc1(w))
+        w = torch.sigmoid_(self.fc2(w))
+        return x * w.unsqueeze(-1).unsqueeze(-1)
+
+
+def _has_conv_bn(module):
+    return isinstance(getattr(module, "conv", None), nn.Conv2d) and \
+        isinstance(getattr(module, "bn", None), nn.BatchNorm2d)
+
+
+def _is_plain_se(module):
+    relu = getattr(module, "relu", getattr(module, "activ", None))
+    return isinstance(getattr(module, "conv1", None), nn.Conv2d) and \
+        isinstance(getattr(module, "conv2", None), nn.Conv2d) and \
+        isinstance(relu, nn.ReLU) and isinstance(getattr(module, "sigmoid", None), nn.Sigmoid)
+
+
+def _fuse_module(module, counter):
+    # blocks are matched by class name and layout, so both these modules and the pytorchcv package are supported
+    name = type(module).__name__
+
+    if name in ("ConvBlock", "InceptConv") and _has_conv_bn(module) and \
+            getattr(module, "use_bn", True) and not getattr(module, "use_pad", False):
+        activ = module.activ if getattr(module, "activate", True) else None
+        counter[0] += 1
+        return FusedConvBlock(fuse_conv_bn(module.conv, module.bn), activ)
+    elif name == "NasConv" and _has_conv_bn(module):
+        # the activation goes first here, so only Batch normalization is folded
+        module.conv = fuse_conv_bn(module.conv, module.bn)
+        module.bn = Identity()
+        counter[0] += 1
+        return module
+    elif name == "SEBlock" and _is_plain_se(module):
+        counter[0] += 1
+        return FusedSEBlock(module)
+
+    for child_name, child in module.named_children():
+        setattr(module, child_name, _fuse_module(child, counter))
+
+    return module
+
+
+def fuse_model(net,
+               inplace=False):
+    """
+    Optimize a built network for inference: fold Batch normalization into convolutions, merge activations
+    into convolution blocks and replace SE blocks with fused ones.
+
+    Parameters:
+    ----------
+    net : Module
+        Network to be optimized.
+    inplace : bool, default False
+        Whether to rewrite the network itself instead of its copy.
+
+    Returns
+    -------
+    Module
+        Optimized network in eval mode.
+    """
+    if not inplace:
+        net = copy.deepcopy(net)
+
+    net.eval()
+    counter = [0]
+    net = _fuse_module(net, counter)
+
+    if counter[0] == 0:
+        raise ValueError("no fusable blocks found in {}".format(type(net).__name__))
+    return net
+
+
+def check_fused_model(net,
+                      fused_net,
+                      in_size=(224, 224),
+                      batch_size=2,
+                      rtol=1e-3):
+    """
+    Check numerical equivalence of the original and the optimized networks on random inputs.
+
+    Parameters:
+    ----------
+    net : Module
+        Original network.
+    fused_net : Module
+        Optimized network.
+    in_size : tuple of two ints, default (224, 224)
+        Spatial size of the input.
+    batch_size : int, default 2
+        Batch size of the input.
+    rtol : float, default 1e-3
+        Maximal allowed difference relative to the output magnitude.
+
+    Returns
+    -------
+    float
+        Maximal absolute difference of the outputs.
+    """
+    device = next(fused_net.parameters()).device
+    x = torch.randn(batch_size, 3, in_size[0], in_size[1], device=device)
+
+    net.eval()
+    with torch.no_grad():
+        y = net(x)
+        y_fused = fused_net(x)
+
+    diff = (y - y_fused).abs().max().item()
+    assert diff <= rtol * max(1.0, y.abs().max().item()), "fused model differs: {}".format(diff)
+    return diff
+
+
+def _calibrate_bn(net, in_size):
+    # randomly initialized networks are badly conditioned, so collect realistic statistics
+    momenta = {}
+    for module in net.modules():
+        if isinstance(module, nn.BatchNorm2d):
+            momenta[module] = module.momentum
+            module.momentum = 1.0
+            if module.affine:
+                module.weight.data.uniform_(0.5, 1.5)
+                module.bias.data.uniform_(-0.1, 0.1)
+
+    net.train()
+    with torch.no_grad():
+        net(torch.randn(4, 3, in_size[0], in_size[1]))
+    net.eval()
+
+    for module, momentum in momenta.items():
+        module.momentum = momentum
+
+
+def _measure_latency(net, in_size, num_iters):
+    x = torch.randn(1, 3, in_size[0], in_size[1])
+    with torch.no_grad():
+        net(x)
+        start = time.time()
+        for _ in range(num_iters):
+            net(x)
+    return (time.time() - start) / num_iters
+
+
+def _test():
+    from .seresnext import seresnext50_32x4d, seresnext101_32x4d
+    from .cbamresnet import cbam_resnet50
+    from .xception import xception
+    from .inceptionresnetv2 import inceptionresnetv2
+    from .pnasnet import pnasnet5large
+
+    num_iters = 5
+
+    models = [
+        (seresnext50_32x4d, (224, 224)),
+        (seresnext101_32x4d, (224, 224)),
+        (cbam_resnet50, (224, 224)),
+        (xception, (299, 299)),
+        (inceptionresnetv2, (299, 299)),
+        (pnasnet5large, (331, 331)),
+    ]
+
+    for model, in_size in models:
+
+        net = model(pretrained=False)
+        _calibrate_bn(net, in_size)
+
+        fused_net = fuse_model(net)
+        diff = check_fused_model(net, fused_net, in_size=in_size)
+
+        time_orig = _measure_latency(net, in_size, num_iters)
+        time_fused = _measure_latency(fused_net, in_size, num_iters)
+        print("m={}, diff={:.2e}, cpu latency {:.1f} ms -> {:.1f} ms ({:.1f}%)".format(
+            model.__name__, diff, time_orig * 1000, time_fused * 1000,
+            (1 - time_fused / time_orig) * 100))
+
+
+if __name__ == "__main__":
+    _test()
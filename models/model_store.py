@@ -2,9 +2,11 @@
     Model store which provides pretrained models.
 """
 
-__all__ = ['get_model_file', 'load_model', 'download_model', 'calc_num_params']
+__all__ = ['get_model_file', 'load_model', 'download_model', 'calc_num_params', 'seed_registry']
 
 import os
+import re
+import json
 import zipfile
 import logging
 import hashlib
@@ -192,6 +194,11 @@ _model_sha1 = {name: (error, checksum, repo_release_tag) for name, error, checks
 
 imgclsmob_repo_url = 'https://github.com/osmr/imgclsmob'
 
+# Verified hashes of weight files, keyed by absolute path, with the size and mtime they were computed for.
+# It lives outside of model directories, since those can be read-only (e.g. Kaggle datasets).
+registry_file_path = os.environ.get('PYTORCHCV_REGISTRY', os.path.join('~', '.torch', 'registry.json'))
+_registry = None
+
 
 def get_model_name_suffix_data(model_name):
     if model_name not in _model_sha1:
@@ -227,11 +234,14 @@ def get_model_file(model_name,
     local_model_store_dir_path = os.path.expanduser(local_model_store_dir_path)
     file_path = os.path.join(local_model_store_dir_path, file_name)
     if os.path.exists(file_path):
-        if _check_sha1(file_path, sha1_hash):
+        if _check_sha1_cached(file_path, sha1_hash):
             return file_path
         else:
             logging.warning('Mismatch in the content of model file detected. Downloading again.')
     else:
+        seeded_file_path = _find_in_registry(sha1_hash)
+        if seeded_file_path is not None:
+            return seeded_file_path
         logging.info('Model file not found. Downloading to {}.'.format(file_path))
 
     if not os.path.exists(local_model_store_dir_path):
@@ -249,12 +259,113 @@ def get_model_file(model_name,
         zf.extractall(local_model_store_dir_path)
     os.remove(zip_file_path)
 
-    if _check_sha1(file_path, sha1_hash):
+    if _check_sha1_cached(file_path, sha1_hash):
         return file_path
     else:
         raise ValueError('Downloaded file has different hash. Please try again.')
 
 
+def _load_registry():
+    global _registry
+    if _registry is None:
+        try:
+            with open(os.path.expanduser(registry_file_path)) as f:
+                _registry = json.load(f)
+        except (OSError, ValueError):
+            _registry = {}
+    return _registry
+
+
+def _save_registry():
+    path = os.path.expanduser(registry_file_path)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(_registry, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError:
+        logging.warning('Cannot save the weight registry to {}.'.format(path))
+
+
+def _check_sha1_cached(file_name, sha1_hash):
+    """
+    Check whether the sha1 hash of the file content matches the expected hash. The file is hashed only if
+    the registry has no hash for its current size and mtime.
+
+    Parameters
+    ----------
+    file_name : str
+        Path to the file.
+    sha1_hash : str
+        Expected sha1 hash in hexadecimal digits.
+
+    Returns
+    -------
+    bool
+        Whether the file content matches the expected hash.
+    """
+    registry = _load_registry()
+    file_name = os.path.abspath(file_name)
+    stat = os.stat(file_name)
+    entry = registry.get(file_name)
+
+    if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+        sha1 = hashlib.sha1()
+        with open(file_name, 'rb') as f:
+            while True:
+                data = f.read(1048576)
+                if not data:
+                    break
+                sha1.update(data)
+
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha1': sha1.hexdigest()}
+        registry[file_name] = entry
+        _save_registry()
+
+    return entry['sha1'] == sha1_hash
+
+
+def _find_in_registry(sha1_hash):
+    """
+    Find a verified file with the given hash, which still has the same size and mtime.
+    """
+    for file_name, entry in _load_registry().items():
+        if entry['sha1'] == sha1_hash and os.path.exists(file_name):
+            stat = os.stat(file_name)
+            if entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+                return file_name
+    return None
+
+
+def seed_registry(dir_path):
+    """
+    Verify all pretrained model files in a directory and record them in the registry, without network access.
+    After that, get_model_file finds them without rehashing, whatever directory it is given.
+
+    Parameters
+    ----------
+    dir_path : str
+        Directory with files named like '<model_name>-<error>-<short_sha1>.pth'.
+
+    Returns
+    -------
+    list of str
+        Names of models with verified weights.
+    """
+    verified = []
+    dir_path = os.path.expanduser(dir_path)
+    for file_name in sorted(os.listdir(dir_path)):
+        m = re.match(r'(.+)-\d+-[0-9a-f]{8}\.pth$', file_name)
+        if not m or m.group(1) not in _model_sha1:
+            continue
+        if _check_sha1_cached(os.path.join(dir_path, file_name), _model_sha1[m.group(1)][1]):
+            verified.append(m.group(1))
+        else:
+            logging.warning('Mismatch in the content of model file {} detected.'.format(file_name))
+    return verified
+
+
 def _download(url, path=None, overwrite=False, sha1_hash=None, retries=5, verify_ssl=True):
     """
     Download an given URL
@@ -382,15 +493,25 @@ def load_model(net,
     ignore_extra : bool, default True
         Whether to silently ignore parameters from the file that are not present in this Module.
     """
-    import torch
+    pretrained_state = _load_state_dict(file_path)
 
     if ignore_extra:
-        pretrained_state = torch.load(file_path)
         model_dict = net.state_dict()
         pretrained_state = {k: v for k, v in pretrained_state.items() if k in model_dict}
-        net.load_state_dict(pretrained_state)
-    else:
-        net.load_state_dict(torch.load(file_path))
+    net.load_state_dict(pretrained_state)
+
+
+def _load_state_dict(file_path):
+    """
+    Load state dictionary memory-mapped, so processes loading the same weights share page cache instead of
+    holding private copies. Falls back to a regular load for old versions of PyTorch and legacy file format.
+    """
+    import torch
+
+    try:
+        return torch.load(file_path, map_location='cpu', mmap=True)
+    except (TypeError, RuntimeError):
+        return torch.load(file_path)
 
 
 def download_model(net,
@@ -434,3 +555,13 @@ def calc_num_params(net):
     for param in net_params:
         weight_count += np.prod(param.size())
     return weight_count
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Verify pretrained model files and record them in the registry')
+    parser.add_argument('dirs', nargs='+', help='directories with pretrained model files')
+    args = parser.parse_args()
+    for dir_path in args.dirs:
+        verified = seed_registry(dir_path)
+        print('{}: {} verified model(s) {}'.format(dir_path, len(verified), ' '.join(verified)))
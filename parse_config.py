@@ -1,19 +1,34 @@
+#!/usr/bin/python3.6
 ''' Reads config file and merges settings with default ones. '''
 
+import copy
+import hashlib
 import multiprocessing
 import os
+import pickle
 import re
+import sys
 import yaml
 
 import torch
 
-from typing import Any
+from glob import glob
+from typing import Any, Dict, List, Tuple
 from easydict import EasyDict as edict
 
 from debug import dprint
 
 IN_KERNEL = os.environ.get('KAGGLE_WORKING_DIR') is not None
 INPUT_PATH = '../input/imet-2019-fgvc6/' if IN_KERNEL else '../input/'
+CONFIG_CACHE_DIR = os.path.expanduser('~/.cache/imet/configs/')
+
+def get_cpu_count() -> int:
+    ''' Returns the number of CPUs available to this process, which is less than
+    cpu_count() in containers and with taskset. '''
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return multiprocessing.cpu_count()
 
 def _get_default_config(filename: str, fold: int) -> edict:
     cfg = edict()
@@ -21,7 +36,13 @@ def _get_default_config(filename: str, fold: int) -> edict:
     cfg.version = os.path.splitext(os.path.basename(filename))[0]
     cfg.experiment_dir = f'../models/{cfg.version}/fold_{fold}/' \
                          if not IN_KERNEL else '.'
-    cfg.num_workers = min(12, multiprocessing.cpu_count())
+    cfg.num_workers = min(12, get_cpu_count())   # the upper bound if loader.auto_workers is set
+
+    cfg.loader = edict()
+    cfg.loader.auto_workers = True      # measure throughput and use as few workers as possible
+    cfg.loader.pin_memory = True
+    cfg.loader.persistent_workers = True  # train loader only
+    cfg.loader.prefetch_factor = 4      # batches per worker
 
     cfg.model = edict()
     cfg.model.arch = 'resnet50'
@@ -35,26 +56,32 @@ def _get_default_config(filename: str, fold: int) -> edict:
     cfg.data = edict()
     cfg.data.train_dir = INPUT_PATH + 'train/'
     cfg.data.test_dir = INPUT_PATH + 'test/'
+    cfg.data.input_dir = ''         # level 2 models only
+    cfg.data.inputs = []
 
     cfg.data.rect_crop = edict()
     cfg.data.rect_crop.enable = False
-    cfg.data.min_ratio = 0.08
-    cfg.data.max_ratio = 1.0
-    cfg.data.scale_both_dims = False
+    cfg.data.rect_crop.min_ratio = 0.08
+    cfg.data.rect_crop.max_ratio = 1.0
+    cfg.data.rect_crop.scale_both_dims = False
+    cfg.data.normalize_on_device = False
 
     cfg.train = edict()
     cfg.train.csv = ''
+    cfg.train.folds_file = 'folds.npy'
     cfg.train.batch_size = 32 * torch.cuda.device_count()
     cfg.train.num_epochs = 10 ** 9
     cfg.train.shuffle = True
     cfg.train.images_per_class = None
     cfg.train.max_steps_per_epoch = 10 ** 9
     cfg.train.log_freq = 100
+    cfg.train.telemetry = False         # log data loader stalls and pipeline timings
     cfg.train.min_lr = 3e-7
     cfg.train.use_balancing_sampler = False
     cfg.train.enable_warmup = False
     cfg.train.head_only_warmup = False
     cfg.train.accum_batches_num = 1
+    cfg.train.auto_batch_size = False
     cfg.train.lr_decay_coeff = 0
     cfg.train.lr_decay_milestones = []
 
@@ -62,10 +89,28 @@ def _get_default_config(filename: str, fold: int) -> edict:
     cfg.train.mixup.enable = False
     cfg.train.mixup.beta_a = 0.5
 
+    cfg.train.buckets = edict()
+    cfg.train.buckets.enable = False
+    cfg.train.buckets.aspect_ratios = [0.5, 0.75, 1.0, 1.333, 2.0]   # height / width
+
+    cfg.train.progressive_resize = edict()
+    cfg.train.progressive_resize.milestones = []    # epochs when input size changes
+    cfg.train.progressive_resize.sizes = []         # new input sizes
+
     cfg.train.warmup = edict()
     cfg.train.warmup.steps = None
     cfg.train.warmup.max_lr = None
 
+    cfg.train.swa = edict()                 # unused, kept for old configs
+    cfg.train.swa.enable = False
+    cfg.train.swa.period = 1
+
+    cfg.train.ema = edict()                 # moving average of weights
+    cfg.train.ema.enable = False
+    cfg.train.ema.decay = 0.9998            # per step
+    cfg.train.ema.update_every = 1          # steps between updates
+    cfg.train.ema.on_cpu = False            # keep averaged weights in host memory
+
     cfg.train.lr_finder = edict()
     cfg.train.lr_finder.num_steps = 10 ** 9     # one epoch max
     cfg.train.lr_finder.beta = 0.98
@@ -94,7 +139,9 @@ def _get_default_config(filename: str, fold: int) -> edict:
     cfg.scheduler2.params = edict()
 
     cfg.cosine = edict()
+    cfg.cosine.start_lr = None
     cfg.cosine.period = 1
+    cfg.cosine.period_mult = 1              # unused, kept for old configs
     cfg.cosine.period_inc = 1
     cfg.cosine.max_period = 1000
     cfg.cosine.min_metric_val = 0.6
@@ -105,6 +152,12 @@ def _get_default_config(filename: str, fold: int) -> edict:
 
     cfg.augmentations = edict()
     cfg.augmentations.global_prob = 1.0
+    cfg.augmentations.dropout = 0           # unused, kept for old configs
+    cfg.augmentations.aug_global_prob = 1.0 # unused, a typo in v6.0.2, which ran with global_prob = 1
+    cfg.augmentations.native_transforms = False
+    cfg.augmentations.fuse_geometric = False
+    cfg.augmentations.fuse_color = False
+    cfg.augmentations.profile = False
 
     cfg.augmentations.hflip = False
     cfg.augmentations.vflip = False
@@ -117,8 +170,10 @@ def _get_default_config(filename: str, fold: int) -> edict:
     cfg.augmentations.rect_crop.rect_min_ratio = 0.75
 
     cfg.augmentations.noise = 0
+    cfg.augmentations.noise_bank = False
     cfg.augmentations.blur = 0
     cfg.augmentations.distortion = 0
+    cfg.augmentations.distortion_bank_size = 0
     cfg.augmentations.color = 0
 
     cfg.augmentations.erase = edict()
@@ -140,7 +195,123 @@ def _merge_config(src: edict, dst: edict) -> edict:
         else:
             dst[k] = v
 
-def load_config(config_path: str, fold: int) -> edict:
+class FrozenDict(dict):
+    ''' Read-only dict with attribute access, for free-form sections like optimizer.params. '''
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def _read_only(self, *args: Any, **kwargs: Any) -> None:
+        raise TypeError('config is read-only, use parse_config.override()')
+
+    __setattr__ = __setitem__ = __delitem__ = _read_only
+    update = pop = popitem = clear = setdefault = _read_only
+
+    def __reduce__(self) -> Any:
+        return FrozenDict, (dict(self),)
+
+class ConfigSection:
+    ''' Base class of compiled config sections. Every section of the schema gets
+    a subclass with slots for its keys, so attribute access is a slot lookup and
+    unknown attributes can't be read or set. '''
+    __slots__ = ()
+    _path = ''
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f'config is read-only, use parse_config.override() '
+                             f'to change {self._path}{name}')
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.__slots__
+
+    def _asdict(self) -> Dict[str, Any]:
+        return {name: _to_plain(getattr(self, name)) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self._asdict()})'
+
+    def __reduce__(self) -> Any:
+        return _compile, (self._path.rstrip('.'), self._asdict())
+
+def _to_plain(value: Any) -> Any:
+    if isinstance(value, ConfigSection):
+        return value._asdict()
+    elif isinstance(value, dict):
+        return {k: _to_plain(v) for k, v in value.items()}
+    elif isinstance(value, tuple):
+        return [_to_plain(v) for v in value]
+    else:
+        return value
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return FrozenDict((k, _freeze(v)) for k, v in value.items())
+    elif isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    else:
+        return value
+
+def _get_schema_section(path: str) -> edict:
+    section = _SCHEMA
+    for name in filter(None, path.split('.')):
+        section = section[name]
+    return section
+
+_section_classes: Dict[str, type] = {}
+
+def _compile(path: str, values: Dict[str, Any]) -> ConfigSection:
+    ''' Builds an immutable section of the schema at the dotted path. Missing keys
+    get default values and unknown keys are dropped, so configs pickled into
+    checkpoints with an older schema can still be loaded. '''
+    if path not in _section_classes:
+        keys = tuple(_get_schema_section(path).keys())
+        name = 'Config' + ''.join(part.title().replace('_', '') for part in path.split('.'))
+        _section_classes[path] = type(name, (ConfigSection,),
+                                      {'__slots__': keys, '_path': path + '.' if path else ''})
+
+    cls = _section_classes[path]
+    section = object.__new__(cls)
+
+    for name in cls.__slots__:
+        schema_value = _get_schema_section(path)[name]
+        value = values[name] if name in values else copy.deepcopy(schema_value)
+
+        if isinstance(schema_value, dict) and schema_value:
+            value = _compile(f'{path}.{name}' if path else name, value)
+        else:
+            value = _freeze(value)
+
+        object.__setattr__(section, name, value)
+
+    return section
+
+def _validate(values: Dict[str, Any], schema: edict, path: str, errors: List[str]) -> None:
+    ''' Checks that every key exists in the schema and has a compatible type. '''
+    for name, value in values.items():
+        full_name = path + name
+
+        if name not in schema:
+            errors.append(f'unknown key {full_name}')
+            continue
+
+        expected = schema[name]
+
+        if isinstance(expected, dict):
+            if not isinstance(value, dict):
+                errors.append(f'{full_name} must be a section')
+            elif expected:     # empty sections are free-form
+                _validate(value, expected, full_name + '.', errors)
+        elif expected is None or value is None:
+            continue
+        elif isinstance(expected, (int, float)) and not isinstance(expected, bool):
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                errors.append(f'{full_name} must be a number, got {value!r}')
+        elif not isinstance(value, type(expected)):
+            errors.append(f'{full_name} must be {type(expected).__name__}, got {value!r}')
+
+def _parse_yaml(config_path: str) -> Dict[str, Any]:
     loader = yaml.SafeLoader
     loader.add_implicit_resolver(
         u'tag:yaml.org,2002:float',
@@ -154,9 +325,97 @@ def load_config(config_path: str, fold: int) -> edict:
         list(u'-+0123456789.'))
 
     with open(config_path) as f:
-        yaml_config = edict(yaml.load(f, Loader=loader))
-
-    config = _get_default_config(config_path, fold)
-    _merge_config(yaml_config, config)
-
-    return config
+        return yaml.load(f, Loader=loader) or {}
+
+def _get_schema_hash() -> str:
+    def describe(section: edict, path: str) -> List[str]:
+        return [item for name, value in section.items()
+                for item in (describe(value, path + name + '.') if isinstance(value, dict)
+                             else [f'{path}{name}:{type(value).__name__}'])]
+
+    return hashlib.sha1(' '.join(describe(_SCHEMA, '')).encode()).hexdigest()
+
+def _load_validated_yaml(config_path: str) -> Dict[str, Any]:
+    ''' Returns the parsed and validated YAML, cached by hashes of the file and the schema. '''
+    with open(config_path, 'rb') as f:
+        key = hashlib.sha1(f.read() + _SCHEMA_HASH.encode()).hexdigest()
+
+    if key in _yaml_cache:
+        return _yaml_cache[key]
+
+    cache_path = os.path.join(CONFIG_CACHE_DIR, key + '.pkl')
+
+    try:
+        with open(cache_path, 'rb') as f:
+            values = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        values = _parse_yaml(config_path)
+        errors: List[str] = []
+        _validate(values, _SCHEMA, '', errors)
+
+        if errors:
+            raise ValueError(f'invalid config {config_path}:\n' + '\n'.join(errors))
+
+        try:
+            os.makedirs(CONFIG_CACHE_DIR, exist_ok=True)
+            tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(values, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:     # read-only home, e.g. in kernels
+            pass
+
+    _yaml_cache[key] = values
+    return values
+
+def load_config(config_path: str, fold: int) -> ConfigSection:
+    ''' Loads the YAML config, merges it with defaults and returns an immutable config.
+    Validated YAML is cached on disk, compiled configs are cached in memory, since
+    defaults depend on the machine. '''
+    yaml_values = _load_validated_yaml(config_path)
+    key = (config_path, fold, id(yaml_values))
+
+    if key not in _config_cache:
+        config = _get_default_config(config_path, fold)
+        _merge_config(edict(yaml_values), config)
+        _config_cache[key] = _compile('', config)
+
+    return _config_cache[key]
+
+def override(config: ConfigSection, overrides: Dict[str, Any]) -> ConfigSection:
+    ''' Returns a copy of the config with values replaced, e.g. {'train.num_epochs': 10}. '''
+    values = config._asdict()
+
+    for path, value in overrides.items():
+        *parents, name = path.split('.')
+        section = values
+
+        for parent in parents:
+            section = section[parent]
+
+        if name not in section:
+            raise KeyError(f'unknown config key {path}')
+
+        section[name] = value
+
+    return _compile('', values)
+
+_SCHEMA = _get_default_config('', 0)
+_SCHEMA_HASH = _get_schema_hash()
+_yaml_cache: Dict[str, Dict[str, Any]] = {}
+_config_cache: Dict[Tuple[str, int, int], ConfigSection] = {}
+
+if __name__ == '__main__':
+    # validates all configs and warms up the cache
+    paths = sys.argv[1:] or sorted(glob('config/*.yml'))
+    num_errors = 0
+
+    for path in paths:
+        try:
+            load_config(path, 0)
+        except ValueError as e:
+            print(e)
+            num_errors += 1
+
+    print(f'{len(paths) - num_errors} of {len(paths)} configs are valid')
+    sys.exit(1 if num_errors else 0)
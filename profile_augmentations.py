@@ -0,0 +1,48 @@
+#!/usr/bin/python3.6
+''' Replays training augmentations of a config on sample images and prints the cost of every transform. '''
+
+import argparse
+import os
+import time
+
+from glob import glob
+
+import numpy as np
+
+from PIL import Image
+
+import albumentations as albu
+import train
+
+from parse_config import load_config
+from utils import create_logger
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config', help='model configuration file (YAML)', type=str)
+    parser.add_argument('--num_images', help='number of sample images', type=int, default=200)
+    parser.add_argument('--num_passes', help='number of passes over sample images', type=int, default=5)
+    parser.add_argument('--input_size', help='override input size', type=int, default=0)
+    args = parser.parse_args()
+
+    train.config = load_config(args.config, 0)
+    train.logger = create_logger(None)
+
+    transform = train.get_train_transform(args.input_size or train.config.model.input_size)
+    print(transform)
+
+    files = sorted(glob(os.path.join(train.config.data.train_dir, '*.png')))[:args.num_images]
+    assert files, 'no images found in ' + train.config.data.train_dir
+    images = [np.array(Image.open(path).convert('RGB')) for path in files]
+
+    albu.profiler.enable()
+    start = time.time()
+
+    for _ in range(args.num_passes):
+        for image in images:
+            transform(image=image)
+
+    elapsed = time.time() - start
+    print(albu.profiler.report())
+    print(f'{len(images) * args.num_passes / elapsed:.1f} images/sec in a single process')
@@ -0,0 +1,82 @@
+''' Post-training static int8 quantization for CPU inference. '''
+
+import copy
+import itertools
+
+from typing import Any
+
+import torch
+import torch.nn as nn
+
+from tqdm import tqdm
+
+
+class QuantizedModel(nn.Module):
+    ''' Wraps a quantized TorchScript module. Always runs on CPU. '''
+    def __init__(self, model: Any) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor: # type: ignore
+        return self.model(x.cpu().contiguous())
+
+def _prepare(model: Any, qconfig_dict: Any, example: torch.Tensor) -> Any:
+    from torch.quantization.quantize_fx import prepare_fx
+
+    try:
+        try:
+            return prepare_fx(model, qconfig_dict, example_inputs=(example,))
+        except TypeError:   # torch < 1.13 doesn't take example inputs
+            return prepare_fx(model, qconfig_dict)
+    except Exception as e:
+        raise RuntimeError(f'could not trace {type(model).__name__} for quantization: {e}')
+
+def quantize_model(model: Any, calib_loader: Any, num_batches: int,
+                   backend: str = 'fbgemm') -> QuantizedModel:
+    ''' Performs static quantization with per-channel weights. Activation ranges
+    are calibrated on the first num_batches batches of calib_loader. '''
+    from torch.quantization import get_default_qconfig
+    from torch.quantization.quantize_fx import convert_fx
+
+    torch.backends.quantized.engine = backend
+
+    if isinstance(model, nn.DataParallel):
+        model = model.module
+
+    model = copy.deepcopy(model).cpu().eval()
+
+    # fbgemm default qconfig: histogram observer for activations,
+    # per-channel symmetric observer for weights
+    qconfig_dict = {'': get_default_qconfig(backend)}
+    prepared = None
+
+    with torch.no_grad():
+        for input_data in tqdm(itertools.islice(calib_loader, num_batches),
+                               total=num_batches):
+            input_ = input_data[0] if isinstance(input_data, (list, tuple)) else input_data
+            if input_.dim() == 5:
+                input_ = input_.view(-1, *input_.shape[2:])
+
+            input_ = input_.cpu()
+
+            if prepared is None:
+                prepared = _prepare(model, qconfig_dict, input_)
+
+            prepared(input_)
+
+    if prepared is None:
+        raise ValueError('no calibration batches, check the calibration set and its batch size')
+
+    return QuantizedModel(convert_fx(prepared))
+
+def save_quantized_model(model: QuantizedModel, path: str, input_size: int) -> None:
+    example = torch.rand(1, 3, input_size, input_size)
+
+    with torch.no_grad():
+        traced = torch.jit.trace(model.model, example)
+
+    torch.jit.save(traced, path)
+
+def load_quantized_model(path: str, backend: str = 'fbgemm') -> QuantizedModel:
+    torch.backends.quantized.engine = backend
+    return QuantizedModel(torch.jit.load(path, map_location='cpu'))
@@ -1,14 +1,30 @@
 ''' Data loaders for training & validation. '''
 
-import os
 import random
+import time
+
+from typing import Any, Dict
+
 import albumentations as albu
+import cv2
 import numpy as np
 
 from PIL import Image
 
 
+def resize(image: np.ndarray, height: int, width: int) -> np.ndarray:
+    ''' Resizes with area interpolation when downscaling and bicubic when upscaling. '''
+    if image.shape[0] == height and image.shape[1] == width:
+        return image
+
+    downscale = height <= image.shape[0] and width <= image.shape[1]
+    interpolation = cv2.INTER_AREA if downscale else cv2.INTER_CUBIC
+    return cv2.resize(image, (width, height), interpolation=interpolation)
+
 class RandomRectCrop(albu.DualTransform):
+    ''' Crops a random rectangle of the given area and aspect ratio ranges and
+    resizes it into input_size x input_size. Sizes are relative to the actual
+    image; image_size is kept for compatibility with configs. '''
     def __init__(self, rect_min_area, rect_min_ratio, image_size, input_size,
                  always_apply=True, p=1.0) -> None:
         super().__init__(always_apply, p)
@@ -20,27 +36,49 @@ class RandomRectCrop(albu.DualTransform):
         self.image_size = image_size
         self.input_size = input_size
 
-    def apply(self, img, y=0, x=0, h=0, w=0, **params):
-        array = array[y : y + h, x : x + w]
-
-        img = Image.fromarray(array)
-        img = img.resize((self.input_size, self.input_size), Image.LANCZOS)
-        return np.array(img)
+    def apply(self, img, area=1.0, ratio=1.0, y=0.0, x=0.0, **params):
+        rows, cols = img.shape[:2]
 
-    def get_params(self):
-        area = random.uniform(self.rect_min_area, 1)
-        ratio = random.uniform(self.rect_min_ratio, 1 / self.rect_min_ratio)
+        h = max(1, min(int(((area / ratio) ** 0.5) * rows), rows))
+        w = max(1, min(int(((area * ratio) ** 0.5) * cols), cols))
+        y, x = int(y * (rows - h)), int(x * (cols - w))
 
-        h = min(int(((area / ratio) ** 0.5) * self.image_size), self.image_size)
-        w = min(int(((area * ratio) ** 0.5) * self.image_size), self.image_size)
+        return resize(img[y : y + h, x : x + w], self.input_size, self.input_size)
 
-        return {'y': int(random.uniform(0, self.image_size - h)),
-                'x': int(random.uniform(0, self.image_size - w)),
-                'h': h,
-                'w': w}
+    def get_params(self) -> Dict[str, float]:
+        return {'area': random.uniform(self.rect_min_area, 1),
+                'ratio': random.uniform(self.rect_min_ratio, 1 / self.rect_min_ratio),
+                'y': random.random(),
+                'x': random.random()}
 
     def apply_to_bbox(self, bbox, **params):
         return bbox
 
     def apply_to_keypoint(self, keypoint, **params):
         return keypoint
+
+def _resize_pil(image: np.ndarray, height: int, width: int) -> np.ndarray:
+    return np.array(Image.fromarray(image).resize((width, height), Image.LANCZOS))
+
+def _measure(func: Any, images: Any, num_iters: int = 5) -> float:
+    start = time.time()
+
+    for _ in range(num_iters):
+        for image, (y, x, h, w) in images:
+            func(image[y : y + h, x : x + w], 288, 288)
+
+    return (time.time() - start) / num_iters / len(images) * 1000
+
+if __name__ == '__main__':
+    # benchmark against PIL resize on crops of typical iMet images
+    image = cv2.resize(np.random.randint(0, 256, (64, 48, 3), dtype=np.uint8), (600, 800))
+    crops = []
+
+    for _ in range(100):
+        params = RandomRectCrop(0.1, 0.75, 0, 288).get_params()
+        h = min(int(((params['area'] / params['ratio']) ** 0.5) * 800), 800)
+        w = min(int(((params['area'] * params['ratio']) ** 0.5) * 600), 600)
+        crops.append((image, (int(params['y'] * (800 - h)), int(params['x'] * (600 - w)), h, w)))
+
+    print(f'PIL LANCZOS: {_measure(_resize_pil, crops):.2f} ms per image')
+    print(f'cv2 INTER_AREA: {_measure(resize, crops):.2f} ms per image')
@@ -1,19 +1,45 @@
 #!/usr/bin/python3.6
-import gzip
 import base64
+import lzma
 import os
+import sys
+import time
+import zipfile
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List
 from glob import glob
 
-# this is base64 encoded source code
-file_data: Dict = {file_data}
+MODULES_ZIP = 'modules.zip'
 
-for path, encoded in file_data.items():
-    path = Path(path)
-    os.makedirs(path.parent, exist_ok=True)
-    # print('unpacking', path)
-    path.write_bytes(gzip.decompress(base64.b64decode(encoded)))
+# {path: [sha1, offset, size]} of files in the bundle
+file_index: Dict[str, List] = {file_index}
+
+# base85 encoded LZMA stream of unique file contents
+bundle = '{bundle}'
+
+start = time.time()
+data = lzma.decompress(base64.b85decode(bundle))
+
+# modules of packages are imported straight from the zip, only top-level
+# scripts and data files are written to disk
+with zipfile.ZipFile(MODULES_ZIP, 'w', zipfile.ZIP_STORED) as modules:
+    for path, (digest, offset, size) in file_index.items():
+        content = data[offset : offset + size]
+
+        if os.path.dirname(path) and path.endswith('.py'):
+            # directory entries are needed for namespace packages like models/
+            directory = os.path.dirname(path) + '/'
+            if directory not in modules.namelist():
+                modules.writestr(directory, b'')
+
+            modules.writestr(path, content)
+        else:
+            path = Path(path)
+            os.makedirs(path.parent, exist_ok=True)
+            path.write_bytes(content)
+
+sys.path.insert(0, os.path.abspath(MODULES_ZIP))
+print(f'unpacked {len(file_index)} files in {time.time() - start:.2f} s')
 
 print('file list after extraction')
 print(list(glob('**/*.py', recursive=True)))
@@ -21,7 +21,8 @@ import torch.backends.cudnn as cudnn
 
 import swa_impl
 
-from data_loader import ImageDataset
+from data_loader import ImageDataset, DeviceNormalizer, DevicePrefetcher
+from loader_factory import create_loader, setup_sharing_strategy
 from parse_config import load_config
 from model import create_model
 from metrics import F_score
@@ -34,7 +35,7 @@ def train_val_split(df: pd.DataFrame, fold: int) -> Tuple[pd.DataFrame, pd.DataF
     return df.loc[folds != fold], df.loc[folds == fold]
 
 def load_data(fold: int) -> Any:
-    torch.multiprocessing.set_sharing_strategy('file_system') # type: ignore
+    setup_sharing_strategy()
     cudnn.benchmark = True # type: ignore
 
     full_df = pd.read_csv('../input/train.csv')
@@ -59,9 +60,8 @@ def load_data(fold: int) -> Any:
     val_dataset = ImageDataset(val_df, mode='val', config=config,
                                num_ttas=num_ttas, augmentor=transform_test)
 
-    data_loader = torch.utils.data.DataLoader(
-        val_dataset, batch_size=config.test.batch_size, shuffle=False,
-        num_workers=config.num_workers, drop_last=True)
+    data_loader = create_loader(val_dataset, config, batch_size=config.test.batch_size,
+                                drop_last=True)
 
     return data_loader
 
@@ -79,6 +79,8 @@ def validate(data_loader: Any, model: Any) -> float:
             else:
                 input_, target = input_data, None
 
+            input_ = normalize(input_)
+
             if data_loader.dataset.num_ttas != 1:
                 bs, ncrops, c, h, w = input_.size()
                 input_ = input_.view(-1, c, h, w)
@@ -154,7 +156,7 @@ def apply_swa(files: List[str], weight: float) -> float:
 
     with torch.no_grad():
         print('updating batchnorm')
-        swa_impl.bn_update(data_loader, avg_model)
+        swa_impl.bn_update(DevicePrefetcher(data_loader, normalize), avg_model)
 
     print('predicting on validation set')
     return validate(data_loader, avg_model)
@@ -177,6 +179,7 @@ if __name__ == '__main__':
     model_name, fold, _, __ = parse_model_name(files[0])
     print(f'model {model_name}, fold {fold}')
     config = load_config(f'config/{model_name}.yml', 0)
+    normalize = DeviceNormalizer(config)
 
     avg_model = create_model(config, pretrained=False)
     cur_model = create_model(config, pretrained=False)
@@ -0,0 +1,190 @@
+''' Telemetry of the input pipeline: tells whether training waits for data loader workers or vice versa. '''
+
+import time
+
+from typing import Any, Iterator, List, Optional
+
+import numpy as np
+import torch
+
+
+class WorkerStats:
+    ''' Decode and augmentation time per data loader worker. It's kept in shared
+    memory, so worker processes update it and the main process reads it. '''
+    def __init__(self, max_workers: int) -> None:
+        # columns: samples, decode time, augmentation time; the last row is the main process
+        self.stats = torch.zeros(max_workers + 1, 3, dtype=torch.float64).share_memory_()
+
+    def update(self, decode_time: float, augment_time: float) -> None:
+        worker_info = torch.utils.data.get_worker_info()
+        row = worker_info.id if worker_info is not None else -1
+
+        self.stats[row, 0] += 1
+        self.stats[row, 1] += decode_time
+        self.stats[row, 2] += augment_time
+
+    def reset(self) -> None:
+        self.stats.zero_()
+
+    def snapshot(self) -> np.ndarray:
+        return self.stats.numpy().copy()
+
+class PipelineTelemetry:
+    ''' Wraps a DataLoader and measures the time spent waiting in next(loader),
+    host-to-device copies and the number of batches ready in the queue. '''
+    def __init__(self, loader: Any) -> None:
+        self.loader = loader
+        self.worker_stats: Optional[WorkerStats] = getattr(loader.dataset, 'worker_stats', None)
+        self.copy_events: List[Any] = []
+        self.reset()
+
+    def reset(self) -> None:
+        self.wait_time = self.copy_time = self.total_time = 0.0
+        self.queue_depths: List[int] = []
+        self.num_steps = 0
+
+        if self.worker_stats is not None:
+            self.worker_stats.reset()
+
+        self.interval = self._new_interval()
+        self.step_end = time.time()
+
+    def _new_interval(self) -> List[float]:
+        stats = self.worker_stats.snapshot() if self.worker_stats is not None else None
+        return [0.0, 0.0, 0.0, stats]    # wait, copy, total, worker stats at start
+
+    def __len__(self) -> int:
+        return len(self.loader)
+
+    def __iter__(self) -> Iterator[Any]:
+        iterator = iter(self.loader)
+        self.step_end = time.time()
+
+        while True:
+            depth = self._get_queue_depth(iterator)
+            start = time.time()
+
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+
+            wait = time.time() - start
+            self.wait_time += wait
+            self.interval[0] += wait
+
+            if depth is not None:
+                self.queue_depths.append(depth)
+
+            yield batch
+
+    @staticmethod
+    def _get_queue_depth(iterator: Any) -> Optional[int]:
+        ''' Returns number of batches, which are ready but not consumed yet. '''
+        data_queue = getattr(iterator, '_data_queue', None)
+        if data_queue is None:
+            return None
+
+        try:
+            depth = data_queue.qsize()
+        except NotImplementedError:     # macOS
+            return None
+
+        # batches which arrived out of order
+        task_info = getattr(iterator, '_task_info', {})
+        return depth + sum(1 for info in task_info.values() if len(info) == 2)
+
+    def copy_started(self) -> None:
+        self._copy_start = self._record_time()
+
+    def copy_finished(self) -> None:
+        self.copy_events.append((self._copy_start, self._record_time()))
+
+    @staticmethod
+    def _record_time() -> Any:
+        ''' CUDA events don't synchronize the host, they're resolved on logging. '''
+        if torch.cuda.is_available():
+            event = torch.cuda.Event(enable_timing=True)
+            event.record()
+            return event
+        else:
+            return time.time()
+
+    def _resolve_copies(self) -> None:
+        for start, end in self.copy_events:
+            if isinstance(start, float):
+                elapsed = end - start
+            else:
+                end.synchronize()
+                elapsed = start.elapsed_time(end) / 1000
+
+            self.copy_time += elapsed
+            self.interval[1] += elapsed
+
+        self.copy_events.clear()
+
+    def step_finished(self) -> None:
+        now = time.time()
+        self.total_time += now - self.step_end
+        self.interval[2] += now - self.step_end
+        self.step_end = now
+        self.num_steps += 1
+
+    def _describe(self, wait: float, copy: float, total: float,
+                  worker_stats: Optional[np.ndarray]) -> str:
+        if total <= 0:
+            return 'no data'
+
+        wait_ratio, copy_ratio = wait / total, copy / total
+
+        if wait_ratio > 0.3:
+            hint = f'data-bound: {wait_ratio:.0%} wait'
+        elif wait_ratio < 0.05:
+            hint = f'compute-bound: {wait_ratio:.0%} wait'
+        else:
+            hint = f'balanced: {wait_ratio:.0%} wait'
+
+        if copy_ratio > 0.1:
+            hint += f', copy-bound: {copy_ratio:.0%} in host-to-device copies'
+        else:
+            hint += f', {copy_ratio:.0%} copy'
+
+        if self.queue_depths:
+            hint += f', queue {np.mean(self.queue_depths[-100:]):.1f}'
+
+        if worker_stats is not None:
+            samples = max(worker_stats[:, 0].sum(), 1)
+            decode_ms = worker_stats[:, 1].sum() / samples * 1000
+            augment_ms = worker_stats[:, 2].sum() / samples * 1000
+            hint += f', per image: decode {decode_ms:.1f} ms, augment {augment_ms:.1f} ms'
+
+        return hint
+
+    def hint(self) -> str:
+        ''' Describes the interval since the previous call. '''
+        self._resolve_copies()
+        wait, copy, total, stats_at_start = self.interval
+
+        worker_stats = None
+        if self.worker_stats is not None:
+            worker_stats = self.worker_stats.snapshot() - stats_at_start
+
+        self.interval = self._new_interval()
+        return self._describe(wait, copy, total, worker_stats)
+
+    def summary(self) -> str:
+        ''' Describes the whole epoch, including every worker. '''
+        self._resolve_copies()
+        worker_stats = self.worker_stats.snapshot() if self.worker_stats is not None else None
+        text = f'pipeline: {self._describe(self.wait_time, self.copy_time, self.total_time, worker_stats)}'
+
+        if self.num_steps:
+            text += f', wait {self.wait_time / self.num_steps * 1000:.1f} ms per step'
+
+        if worker_stats is not None:
+            workers = [f'{i if i < len(worker_stats) - 1 else "main"}: {int(n)} images, '
+                       f'{(decode + augment) / n * 1000:.1f} ms each'
+                       for i, (n, decode, augment) in enumerate(worker_stats) if n > 0]
+            text += '\nworkers: ' + '; '.join(workers)
+
+        return text
@@ -23,24 +23,31 @@ import torch.nn as nn
 import torch.backends.cudnn as cudnn
 import torch.nn.functional as F
 
-from sklearn.preprocessing import LabelEncoder
 from tqdm import tqdm
 from easydict import EasyDict as edict
 
 import albumentations as albu
 
-from data_loader import ImageDataset
-from utils import create_logger, AverageMeter
+from data_loader import ImageDataset, DeviceNormalizer, DevicePrefetcher
+from utils import create_logger, AverageMeter, DeviceAverageMeter
 from debug import dprint
 
-from parse_config import load_config
+from parse_config import load_config, override
+from batch_tuner import tune_batch_size
 from losses import get_loss
 from schedulers import get_scheduler, is_scheduler_continuous, get_warmup_scheduler
 from optimizers import get_optimizer, get_lr, set_lr
-from metrics import F_score
+from metrics import F_score, F_score_per_sample
+from crypto import decrypt_to_buffer
 from random_rect_crop import RandomRectCrop
+from bucket_sampler import BucketBatchSampler, get_crop_shape
+from loader_factory import create_loader, setup_sharing_strategy, shutdown_loader
+from telemetry import PipelineTelemetry
+from ema import ModelEMA
 from random_erase import RandomErase
 from model import create_model, freeze_layers, unfreeze_layers
+from quantization import QuantizedModel, quantize_model, save_quantized_model, \
+                         load_quantized_model
 from cosine_scheduler import CosineLRWithRestarts
 from torch.optim.lr_scheduler import ReduceLROnPlateau
 
@@ -49,9 +56,6 @@ INPUT_PATH = '../input/imet-2019-fgvc6/' if IN_KERNEL else '../input/'
 ADDITIONAL_DATASET_PATH = '../input/imet-datasets/'
 THRESHOLDS_PATH = '../yml/' if not IN_KERNEL else '../input/imet-yaml/yml/'
 
-if not IN_KERNEL:
-    import torchsummary
-
 
 def find_input_file(path: str) -> str:
     path = INPUT_PATH + os.path.basename(path)
@@ -85,28 +89,15 @@ def train_val_split(df: pd.DataFrame, fold: int) -> Tuple[pd.DataFrame, pd.DataF
     assert folds.shape[0] == df.shape[0]
     return df.loc[folds != fold], df.loc[folds == fold]
 
-def load_data(fold: int) -> Any:
-    torch.multiprocessing.set_sharing_strategy('file_system') # type: ignore
-    cudnn.benchmark = True # type: ignore
-
-    logger.info('config:')
-    logger.info(pprint.pformat(config))
-
-    full_df = pd.read_csv(find_input_file(INPUT_PATH + config.train.csv))
-    print('full_df', full_df.shape)
-    train_df, _ = train_val_split(full_df, fold)
-    print('train_df', train_df.shape)
-
-    # use original train.csv for validation
-    full_df2 = pd.read_csv(INPUT_PATH + 'train.csv')
-    assert full_df2.shape == full_df.shape
-    _, val_df = train_val_split(full_df2, fold)
-    print('val_df', val_df.shape)
-
-    test_df = pd.read_csv(find_input_file(INPUT_PATH + 'sample_submission.csv'))
-
+def get_train_transform(input_size: int, crop: bool = True,
+                        crop_shapes: Optional[List[Tuple[int, int]]] = None) -> Any:
     augs: List[Union[albu.BasicTransform, albu.OneOf]] = []
 
+    if config.augmentations.native_transforms:
+        piecewise_affine, sharpen, emboss = albu.PiecewiseAffine, albu.Sharpen, albu.Emboss
+    else:
+        piecewise_affine, sharpen, emboss = albu.IAAPiecewiseAffine, albu.IAASharpen, albu.IAAEmboss
+
     if config.augmentations.hflip:
         augs.append(albu.HorizontalFlip(.5))
     if config.augmentations.vflip:
@@ -125,12 +116,15 @@ def load_data(fold: int) -> Any:
         augs.append(RandomRectCrop(rect_min_area=config.augmentations.rect_crop.rect_min_area,
                                    rect_min_ratio=config.augmentations.rect_crop.rect_min_ratio,
                                    image_size=config.model.image_size,
-                                   input_size=config.model.input_size))
+                                   input_size=input_size))
 
     if config.augmentations.noise != 0:
+        use_bank = config.augmentations.noise_bank
+
         augs.append(albu.OneOf([
-            albu.IAAAdditiveGaussianNoise(),
-            albu.GaussNoise(),
+            albu.AdditiveGaussianNoise(use_bank=use_bank) if config.augmentations.native_transforms
+            else albu.IAAAdditiveGaussianNoise(),
+            albu.GaussNoise(use_bank=use_bank),
         ], p=config.augmentations.noise))
 
     if config.augmentations.blur != 0:
@@ -141,17 +135,30 @@ def load_data(fold: int) -> Any:
         ], p=config.augmentations.blur))
 
     if config.augmentations.distortion != 0:
+        if config.augmentations.distortion_bank_size:
+            # remap tables are built here for every crop shape, so they're shared by all workers
+            num_maps = config.augmentations.distortion_bank_size
+            optical = albu.BankedOpticalDistortion(num_maps=num_maps, p=0.3)
+            grid = albu.BankedGridDistortion(num_maps=num_maps, p=.1)
+
+            for height, width in crop_shapes or [(input_size, input_size)]:
+                optical.prepare(height, width)
+                grid.prepare(height, width)
+        else:
+            optical = albu.OpticalDistortion(p=0.3)
+            grid = albu.GridDistortion(p=.1)
+
         augs.append(albu.OneOf([
-            albu.OpticalDistortion(p=0.3),
-            albu.GridDistortion(p=.1),
-            albu.IAAPiecewiseAffine(p=0.3),
+            optical,
+            grid,
+            piecewise_affine(p=0.3),
         ], p=config.augmentations.distortion))
 
     if config.augmentations.color != 0:
         augs.append(albu.OneOf([
             albu.CLAHE(clip_limit=2),
-            albu.IAASharpen(),
-            albu.IAAEmboss(),
+            sharpen(),
+            emboss(),
             albu.RandomBrightnessContrast(),
         ], p=config.augmentations.color))
 
@@ -160,14 +167,87 @@ def load_data(fold: int) -> Any:
                                 max_area=config.augmentations.erase.max_area,
                                 min_ratio=config.augmentations.erase.min_ratio,
                                 max_ratio=config.augmentations.erase.max_ratio,
-                                input_size=config.model.input_size,
                                 p=config.augmentations.erase.prob))
 
-    transform_train = albu.Compose([
-        albu.PadIfNeeded(config.model.input_size, config.model.input_size),
-        albu.RandomCrop(height=config.model.input_size, width=config.model.input_size),
-        albu.Compose(augs, p=config.augmentations.global_prob),
-        ])
+    if crop:
+        transform_train = albu.Compose([
+            albu.PadIfNeeded(input_size, input_size),
+            albu.RandomCrop(height=input_size, width=input_size),
+            albu.Compose(augs, p=config.augmentations.global_prob),
+            ])
+    else:
+        transform_train = albu.Compose([
+            albu.Compose(augs, p=config.augmentations.global_prob),
+            ])
+
+    if config.augmentations.fuse_geometric:
+        transform_train = albu.fuse_geometric(transform_train)
+    if config.augmentations.fuse_color:
+        transform_train = albu.fuse_color(transform_train)
+
+    if config.augmentations.fuse_geometric or config.augmentations.fuse_color:
+        logger.info(f'fused transforms: {albu.fusion_report(transform_train)}')
+
+    return transform_train
+
+def create_train_loader(train_df: pd.DataFrame, input_size: int) -> Any:
+    buckets = config.train.buckets.enable
+    crop_shapes = [get_crop_shape(ratio, input_size)
+                   for ratio in config.train.buckets.aspect_ratios] if buckets else None
+
+    augmentor = get_train_transform(input_size, crop=not buckets, crop_shapes=crop_shapes)
+    train_dataset = ImageDataset(train_df, mode='train', config=config,
+                                 augmentor=augmentor, input_size=input_size)
+
+    if config.train.telemetry:
+        train_dataset.enable_telemetry(config.num_workers)
+
+    if buckets:
+        assert not config.augmentations.rect_crop.enable, 'RandomRectCrop makes square images'
+        sampler = BucketBatchSampler(train_dataset.get_image_sizes(),
+                                     batch_size=config.train.batch_size,
+                                     input_size=input_size,
+                                     aspect_ratios=config.train.buckets.aspect_ratios)
+        logger.info(f'aspect ratio buckets: {sampler.summary()}')
+
+        return create_loader(train_dataset, config, batch_sampler=sampler, tune=True,
+                             persistent=True)
+
+    return create_loader(train_dataset, config, batch_size=config.train.batch_size,
+                         shuffle=True, drop_last=True, tune=True, persistent=True)
+
+def get_input_size(epoch: int) -> int:
+    ''' Returns the train input size for the epoch, according to the progressive
+    resizing schedule. '''
+    schedule = config.train.progressive_resize
+    assert len(schedule.milestones) == len(schedule.sizes)
+    input_size = config.model.input_size
+
+    for milestone, size in zip(schedule.milestones, schedule.sizes):
+        if epoch >= milestone:
+            input_size = size
+
+    return input_size
+
+def load_data(fold: int) -> Any:
+    setup_sharing_strategy()
+    cudnn.benchmark = True # type: ignore
+
+    logger.info('config:')
+    logger.info(pprint.pformat(config._asdict()))
+
+    full_df = pd.read_csv(find_input_file(INPUT_PATH + config.train.csv))
+    print('full_df', full_df.shape)
+    train_df, _ = train_val_split(full_df, fold)
+    print('train_df', train_df.shape)
+
+    # use original train.csv for validation
+    full_df2 = pd.read_csv(INPUT_PATH + 'train.csv')
+    assert full_df2.shape == full_df.shape
+    _, val_df = train_val_split(full_df2, fold)
+    print('val_df', val_df.shape)
+
+    test_df = pd.read_csv(find_input_file(INPUT_PATH + 'sample_submission.csv'))
 
     if config.test.num_ttas > 1:
         transform_test = albu.Compose([
@@ -183,9 +263,8 @@ def load_data(fold: int) -> Any:
             albu.HorizontalFlip(.5)
         ])
 
-
-    train_dataset = ImageDataset(train_df, mode='train', config=config,
-                                 augmentor=transform_train)
+    if config.augmentations.fuse_geometric:
+        transform_test = albu.fuse_geometric(transform_test)
 
     num_ttas_for_val = config.test.num_ttas if args.predict_oof else 1
     val_dataset = ImageDataset(val_df, mode='val', config=config,
@@ -195,17 +274,18 @@ def load_data(fold: int) -> Any:
                                 num_ttas=config.test.num_ttas,
                                 augmentor=transform_test)
 
-    train_loader = torch.utils.data.DataLoader(
-        train_dataset, batch_size=config.train.batch_size, shuffle=True,
-        num_workers=config.num_workers, drop_last=True)
+    # inference doesn't need the train loader, which builds augmentations
+    inference_only = args.predict_oof or args.predict_test or args.quantize
+    train_loader = create_train_loader(train_df, get_input_size(0)) if not inference_only else None
 
-    val_loader = torch.utils.data.DataLoader(
-        val_dataset, batch_size=config.train.batch_size, shuffle=False,
-        num_workers=config.num_workers)
+    if args.quantize:
+        # int8 calibration uses a slice of the train split, so the validation score stays fair
+        calib_df = train_df.sample(n=min(args.calib_images, train_df.shape[0]), random_state=0)
+        calib_dataset = ImageDataset(calib_df, mode='val', config=config, augmentor=transform_test)
+        train_loader = create_loader(calib_dataset, config, batch_size=config.train.batch_size)
 
-    test_loader = torch.utils.data.DataLoader(
-        test_dataset, batch_size=config.test.batch_size, shuffle=False,
-        num_workers=config.num_workers)
+    val_loader = create_loader(val_dataset, config, batch_size=config.train.batch_size)
+    test_loader = create_loader(test_dataset, config, batch_size=config.test.batch_size)
 
     return train_loader, val_loader, test_loader
 
@@ -237,7 +317,7 @@ def lr_finder(train_loader: Any, model: Any, criterion: Any, optimizer: Any) ->
 
         set_lr(optimizer, lr)
 
-        output = model(input_.cuda())
+        output = model(normalize(input_).cuda())
         loss = criterion(output, target.cuda())
         loss_val = loss.data.item()
 
@@ -314,13 +394,13 @@ def mixup(x: torch.Tensor, y: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]
 
 def train_epoch(train_loader: Any, model: Any, criterion: Any, optimizer: Any,
                 epoch: int, lr_scheduler: Any, lr_scheduler2: Any,
-                max_steps: Optional[int]) -> None:
+                max_steps: Optional[int], ema: Optional[ModelEMA] = None) -> None:
     logger.info(f'epoch: {epoch}')
     logger.info(f'learning rate: {get_lr(optimizer)}')
 
     batch_time = AverageMeter()
-    losses = AverageMeter()
-    avg_score = AverageMeter()
+    losses = DeviceAverageMeter()
+    avg_score = DeviceAverageMeter()
 
     model.train()
     optimizer.zero_grad()
@@ -334,28 +414,36 @@ def train_epoch(train_loader: Any, model: Any, criterion: Any, optimizer: Any,
     end = time.time()
     lr_str = ''
 
-    for i, (input_, target) in enumerate(train_loader):
+    if config.augmentations.profile:
+        albu.profiler.reset()
+
+    telemetry = PipelineTelemetry(train_loader) if config.train.telemetry else None
+    prefetcher = DevicePrefetcher(telemetry or train_loader, normalize, telemetry=telemetry)
+
+    for i, (input_, target) in enumerate(prefetcher):
         if i >= num_steps:
             break
 
-        input_ = input_.cuda()
-
         if config.train.mixup.enable:
             input_, target = mixup(input_, target)
 
         output = model(input_)
-        loss = criterion(output, target.cuda())
+        loss = criterion(output, target)
 
-        predict = (output.detach() > 0.1).type(torch.FloatTensor)
-        avg_score.update(F_score(predict, target, beta=2))
+        # metrics stay on GPU, they're synchronized only when logged
+        predict = (output.detach() > 0.1).float()
+        avg_score.update(F_score_per_sample(predict, target, beta=2).mean())
 
-        losses.update(loss.data.item(), input_.size(0))
+        losses.update(loss, input_.size(0))
         loss.backward()
 
         if (i + 1) % config.train.accum_batches_num == 0:
             optimizer.step()
             optimizer.zero_grad()
 
+            if ema is not None:
+                ema.step(model)
+
         if is_scheduler_continuous(lr_scheduler):
             lr_scheduler.step()
             lr_str = f'\tlr {get_lr(optimizer):.02e}'
@@ -366,6 +454,9 @@ def train_epoch(train_loader: Any, model: Any, criterion: Any, optimizer: Any,
         batch_time.update(time.time() - end)
         end = time.time()
 
+        if telemetry:
+            telemetry.step_finished()
+
         if i % config.train.log_freq == 0:
             logger.info(f'{epoch} [{i}/{num_steps}]\t'
                         f'time {batch_time.val:.3f} ({batch_time.avg:.3f})\t'
@@ -373,8 +464,17 @@ def train_epoch(train_loader: Any, model: Any, criterion: Any, optimizer: Any,
                         f'F2 {avg_score.val:.4f} ({avg_score.avg:.4f})'
                         + lr_str)
 
+            if telemetry:
+                logger.info(f'{epoch} [{i}/{num_steps}]\t{telemetry.hint()}')
+
     logger.info(f' * average F2 on train {avg_score.avg:.4f}')
 
+    if telemetry:
+        logger.info(telemetry.summary())
+
+    if config.augmentations.profile:
+        logger.info(albu.profiler.report())
+
 def inference(data_loader: Any, model: Any) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
     ''' Returns predictions and targets, if any. '''
     model.eval()
@@ -382,8 +482,13 @@ def inference(data_loader: Any, model: Any) -> Tuple[torch.Tensor, Optional[torc
     sigmoid = nn.Sigmoid()
     predicts_list, targets_list = [], []
 
+    # quantized and --quantize models run on CPU, targets are concatenated on CPU
+    on_cpu = isinstance(model, QuantizedModel) or not next(model.parameters()).is_cuda
+    device = 'cpu' if on_cpu else None
+    prefetcher = DevicePrefetcher(data_loader, normalize, device=device, images_only=True)
+
     with torch.no_grad():
-        for input_data in tqdm(data_loader, disable=IN_KERNEL):
+        for input_data in tqdm(prefetcher, disable=IN_KERNEL):
             if data_loader.dataset.mode != 'test':
                 input_, target = input_data
             else:
@@ -403,7 +508,7 @@ def inference(data_loader: Any, model: Any) -> Tuple[torch.Tensor, Optional[torc
                 else:
                     assert False
             else:
-                output = model(input_.cuda())
+                output = model(input_)
                 output = sigmoid(output)
 
             predicts_list.append(output.detach().cpu().numpy())
@@ -434,19 +539,37 @@ def validate(val_loader: Any, model: Any, epoch: int) -> Tuple[float, float, np.
     logger.info(f' * F2 on validation {best_score:.4f}')
     return best_score, best_thresh, predicts.numpy()
 
+def get_model_name(model_path: str) -> str:
+    ''' Returns the model file name without extensions, including .enc. '''
+    filename = os.path.basename(model_path)
+    if filename.endswith('.enc'):
+        filename = filename[:-4]
+
+    return os.path.splitext(filename)[0]
+
+def load_checkpoint(path: str, map_location: Any = None) -> Any:
+    ''' Loads a checkpoint, encrypted ones are decrypted in memory. '''
+    return torch.load(decrypt_to_buffer(path) if path.endswith('.enc') else path,
+                      map_location=map_location)
+
+def get_trained_weights(checkpoint: Dict[str, Any]) -> Dict[str, Any]:
+    ''' Returns weights to resume training from. state_dict may hold averaged weights,
+    while the optimizer state belongs to the trained ones. '''
+    return checkpoint.get('raw_state_dict', checkpoint['state_dict'])
+
 def gen_train_prediction(data_loader: Any, model: Any, epoch: int,
                          model_path: str) -> np.ndarray:
     score, threshold, predicts = validate(data_loader, model, epoch)
     predicts -= threshold
 
-    filename = os.path.splitext(os.path.basename(model_path))[0]
+    filename = get_model_name(model_path)
     np.save(f'level1_train_{filename}.npy', predicts)
 
     with open(f'{filename}.yml', 'w') as f:
         yaml.dump({'threshold': threshold}, f)
 
 def gen_test_prediction(data_loader: Any, model: Any, model_path: str) -> np.ndarray:
-    threshold_file = threshold_files[os.path.splitext(os.path.basename(model_path))[0] + '.yml']
+    threshold_file = threshold_files[get_model_name(model_path) + '.yml']
 
     with open(threshold_file) as f:
         threshold = yaml.load(f, Loader=yaml.SafeLoader)['threshold']
@@ -454,21 +577,57 @@ def gen_test_prediction(data_loader: Any, model: Any, model_path: str) -> np.nda
     predicts, _ = inference(data_loader, model)
     predicts -= threshold
 
-    filename = f'level1_test_{os.path.splitext(os.path.basename(model_path))[0]}'
+    filename = f'level1_test_{get_model_name(model_path)}'
     np.save(filename, predicts)
 
+def quantize(calib_loader: Any, val_loader: Any, model: Any, epoch: int,
+             model_path: str) -> None:
+    ''' Calibrates int8 model on a part of the train set and reports F2 delta on validation. '''
+    if isinstance(model, nn.DataParallel):
+        model = model.module    # DataParallel expects parameters on GPU, this model is on CPU
+
+    num_batches = len(calib_loader)
+    logger.info(f'calibrating int8 model on {num_batches} batches')
+    calib_batches = (normalize(input_, 'cpu') for input_, _ in calib_loader)
+    int8_model = quantize_model(model, calib_batches, num_batches)
+
+    fp32_score, _, _ = validate(val_loader, model, epoch)
+    int8_score, _, _ = validate(val_loader, int8_model, epoch)
+    logger.info(f'F2 fp32 {fp32_score:.4f} int8 {int8_score:.4f} '
+                f'delta {int8_score - fp32_score:+.4f}')
+
+    int8_path = os.path.join(os.path.dirname(model_path), get_model_name(model_path) + '.int8.pt')
+    save_quantized_model(int8_model, int8_path, config.model.input_size)
+    logger.info(f'quantized model was saved to {int8_path}')
+
 def run() -> float:
     np.random.seed(0)
     model_dir = config.experiment_dir
 
     logger.info('=' * 50)
 
+    if config.augmentations.profile:
+        albu.profiler.enable(os.path.join(config.experiment_dir, 'aug_profile'))
+
     train_loader, val_loader, test_loader = load_data(args.fold)
+
+    if args.int8:
+        assert args.predict_test and args.weights is not None
+        logger.info(f'loading quantized model {args.int8}')
+        gen_test_prediction(test_loader, load_quantized_model(args.int8), args.weights)
+        sys.exit()
+
     logger.info(f'creating a model {config.model.arch}')
-    model = create_model(config, pretrained=args.weights is None).cuda()
+    model = create_model(config, pretrained=args.weights is None)
+
+    # int8 calibration runs on CPU, so --quantize works on machines without GPU
+    if not args.quantize:
+        model = model.cuda()
+
     criterion = get_loss(config)
 
     if args.summary:
+        import torchsummary
         torchsummary.summary(model, (3, config.model.input_size, config.model.input_size))
 
     if args.lr_finder:
@@ -504,7 +663,7 @@ def run() -> float:
     if args.weights is None:
         last_epoch = -1
     else:
-        last_checkpoint = torch.load(args.weights)
+        last_checkpoint = load_checkpoint(args.weights, 'cpu' if args.quantize else None)
         model_arch = last_checkpoint['arch'].replace('se_', 'se')
 
         if model_arch != config.model.arch:
@@ -512,7 +671,17 @@ def run() -> float:
             dprint(config.model.arch)
             assert model_arch == config.model.arch
 
-        model.load_state_dict(last_checkpoint['state_dict'])
+        inference_only = args.predict_oof or args.predict_test or args.quantize
+
+        if args.ema:
+            assert inference_only, '--ema is for inference, training resumes from trained weights'
+            assert 'ema' in last_checkpoint, 'the checkpoint has no averaged weights'
+            model.load_state_dict(last_checkpoint['ema']['state_dict'])
+        elif inference_only:
+            model.load_state_dict(last_checkpoint['state_dict'])
+        else:
+            model.load_state_dict(get_trained_weights(last_checkpoint))
+
         if 'optimizer' in last_checkpoint.keys():
             optimizer.load_state_dict(last_checkpoint['optimizer'])
         logger.info(f'checkpoint loaded: {args.weights}')
@@ -527,6 +696,32 @@ def run() -> float:
         elif 'base_lr' in config.scheduler.params:
             set_lr(optimizer, config.scheduler.params.base_lr)
 
+    if args.quantize:
+        assert args.weights is not None
+        quantize(train_loader, val_loader, model, last_epoch, args.weights)
+        sys.exit()
+
+    if args.predict_oof or args.predict_test:
+        print('inference mode')
+        assert args.weights is not None
+
+        if args.fuse:
+            from models.fusion import fuse_model, check_fused_model
+            logger.info('folding batchnorms for inference')
+            fused_model = fuse_model(model)
+
+            size = config.model.input_size
+            diff = check_fused_model(model, fused_model, in_size=(size, size))
+            logger.info(f'fused model matches the original, max difference {diff:.2e}')
+            model = fused_model
+
+        if args.predict_oof:
+            gen_train_prediction(val_loader, model, last_epoch, args.weights)
+        else:
+            gen_test_prediction(test_loader, model, args.weights)
+
+        sys.exit()
+
     if not args.cosine:
         lr_scheduler = get_scheduler(config.scheduler, optimizer, last_epoch=
                                      (last_epoch if config.scheduler.name != 'cyclic_lr' else -1))
@@ -546,16 +741,13 @@ def run() -> float:
                                             max_period=config.cosine.max_period)
         lr_scheduler2 = None
 
-    if args.predict_oof or args.predict_test:
-        print('inference mode')
-        assert args.weights is not None
+    ema = None
+    if config.train.ema.enable:
+        ema = ModelEMA(model, config.train.ema.decay, config.train.ema.update_every,
+                       device='cpu' if config.train.ema.on_cpu else None)
 
-        if args.predict_oof:
-            gen_train_prediction(val_loader, model, last_epoch, args.weights)
-        else:
-            gen_test_prediction(test_loader, model, args.weights)
-
-        sys.exit()
+        if args.weights is not None and 'ema' in last_checkpoint:
+            ema.load_state_dict(last_checkpoint['ema'])
 
     logger.info(f'training will start from epoch {last_epoch + 1}')
 
@@ -574,11 +766,15 @@ def run() -> float:
 
             if lr < last_lr - 1e-10 and best_model_path is not None:
                 logger.info(f'learning rate dropped: {lr}, reloading')
-                last_checkpoint = torch.load(best_model_path)
+                last_checkpoint = load_checkpoint(best_model_path)
 
                 assert(last_checkpoint['arch']==config.model.arch)
-                model.load_state_dict(last_checkpoint['state_dict'])
+                model.load_state_dict(get_trained_weights(last_checkpoint))
                 optimizer.load_state_dict(last_checkpoint['optimizer'])
+
+                if ema is not None and 'ema' in last_checkpoint:
+                    ema.load_state_dict(last_checkpoint['ema'])
+
                 logger.info(f'checkpoint loaded: {best_model_path}')
                 set_lr(optimizer, lr)
                 last_lr = lr
@@ -593,6 +789,12 @@ def run() -> float:
                                          coeff=total_coeff, last_epoch=-1)
                                          # (last_epoch if config.scheduler.name != 'cyclic_lr' else -1))
 
+        input_size = get_input_size(epoch)
+        if input_size != train_loader.dataset.input_size:
+            logger.info(f'progressive resizing: switching to input size {input_size}')
+            shutdown_loader(train_loader)
+            train_loader = create_train_loader(train_loader.dataset.df, input_size)
+
         if isinstance(lr_scheduler, CosineLRWithRestarts):
             restart = lr_scheduler.epoch_step()
             if restart:
@@ -600,8 +802,16 @@ def run() -> float:
                 best_score = min(config.cosine.min_metric_val, best_score)
 
         train_epoch(train_loader, model, criterion, optimizer, epoch,
-                    lr_scheduler, lr_scheduler2, config.train.max_steps_per_epoch)
+                    lr_scheduler, lr_scheduler2, config.train.max_steps_per_epoch, ema)
         score, _, _ = validate(val_loader, model, epoch)
+        best_of_both = score
+
+        if ema is not None:
+            logger.info('validating averaged weights')
+            with ema.swapped(model):
+                ema_score, _, _ = validate(val_loader, model, epoch)
+
+            best_of_both = max(score, ema_score)
 
         if type(lr_scheduler) == ReduceLROnPlateau:
             lr_scheduler.step(metrics=score)
@@ -613,24 +823,36 @@ def run() -> float:
         elif lr_scheduler2 and not is_scheduler_continuous(lr_scheduler2):
             lr_scheduler2.step()
 
-        is_best = score > best_score
-        best_score = max(score, best_score)
+        # schedulers follow the trained weights, but a snapshot is saved if either is better
+        is_best = best_of_both > best_score
+        best_score = max(best_of_both, best_score)
         if is_best:
             best_epoch = epoch
 
         if is_best:
             best_model_path = os.path.join(model_dir,
-                f'{config.version}_f{args.fold}_e{epoch:02d}_{score:.04f}.pth')
+                f'{config.version}_f{args.fold}_e{epoch:02d}_{best_of_both:.04f}.pth')
+
+            # state_dict always holds the weights, which have the score from the file name
+            ema_won = ema is not None and ema_score > score
 
             data_to_save = {
                 'epoch': epoch,
                 'arch': config.model.arch,
-                'state_dict': model.state_dict(),
-                'score': score,
+                'state_dict': ema.module.state_dict() if ema_won else model.state_dict(),
+                'score': best_of_both,
                 'optimizer': optimizer.state_dict(),
                 'config': config
             }
 
+            if ema is not None:
+                data_to_save['ema'] = ema.state_dict()
+                data_to_save['ema_score'] = ema_score
+                data_to_save['raw_score'] = score
+
+            if ema_won:
+                data_to_save['raw_state_dict'] = model.state_dict()
+
             torch.save(data_to_save, best_model_path)
             logger.info(f'a snapshot was saved to {best_model_path}')
 
@@ -650,6 +872,11 @@ if __name__ == '__main__':
     parser.add_argument('--num_epochs', help='override number of epochs', type=int, default=0)
     parser.add_argument('--num_ttas', help='override number of TTAs', type=int, default=0)
     parser.add_argument('--cosine', help='enable cosine annealing', type=bool, default=True)
+    parser.add_argument('--quantize', help='calibrate int8 model, report F2 delta and save it', action='store_true')
+    parser.add_argument('--calib_images', help='number of train images for int8 calibration', type=int, default=512)
+    parser.add_argument('--fuse', help='fold batchnorms into convolutions for prediction', action='store_true')
+    parser.add_argument('--int8', help='quantized model to use with --predict_test', type=str)
+    parser.add_argument('--ema', help='use averaged weights from the checkpoint', action='store_true')
     args = parser.parse_args()
 
     if not args.config:
@@ -658,7 +885,7 @@ if __name__ == '__main__':
             sys.exit()
 
         # f'{config.version}_f{args.fold}_e{epoch:02d}_{score:.04f}.pth')
-        m = re.match(r'(.*)_f(\d)_e(\d+)_([.0-9]+)\.pth', os.path.basename(args.weights))
+        m = re.match(r'(.*)_f(\d)_e(\d+)_([.0-9]+)\.pth(\.enc)?', os.path.basename(args.weights))
         if not m:
             print('could not parse model name', os.path.basename(args.weights))
             assert False
@@ -671,19 +898,24 @@ if __name__ == '__main__':
     config = load_config(args.config, args.fold)
 
     if args.num_epochs:
-        config.train.num_epochs = args.num_epochs
+        config = override(config, {'train.num_epochs': args.num_epochs})
 
     if args.num_ttas:
-        config.test.num_ttas = args.num_ttas
+        config = override(config, {'test.num_ttas': args.num_ttas})
         # config.test.batch_size //= args.num_ttas # ideally, I'd like to use big batches
 
+    if config.train.auto_batch_size and not (args.predict_oof or args.predict_test):
+        config = tune_batch_size(config)
+
     if not os.path.exists(config.experiment_dir):
         os.makedirs(config.experiment_dir)
 
+    normalize = DeviceNormalizer(config)
+
     threshold_files = {os.path.basename(path): path for path in glob(THRESHOLDS_PATH + '*.yml')}
     assert len(threshold_files)
 
     log_filename = 'log_predict.txt' if args.predict_oof or args.predict_test \
-                    else 'log_training.txt'
+                    or args.quantize else 'log_training.txt'
     logger = create_logger(os.path.join(config.experiment_dir, log_filename))
     run()
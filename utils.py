@@ -50,3 +50,27 @@ class AverageMeter:
         self.count += n
         self.avg = self.sum / self.count
 
+class DeviceAverageMeter:
+    """Like AverageMeter, but accumulates tensors on their device. The host
+    is synchronized only when val or avg are read."""
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.last: Optional[torch.Tensor] = None
+        self.sum: Optional[torch.Tensor] = None
+        self.count = 0
+
+    def update(self, val: torch.Tensor, n: int = 1) -> None:
+        val = val.detach()
+        self.last = val
+        self.sum = val * n if self.sum is None else self.sum + val * n
+        self.count += n
+
+    @property
+    def val(self) -> float:
+        return self.last.item() if self.last is not None else 0.0
+
+    @property
+    def avg(self) -> float:
+        return self.sum.item() / self.count if self.count else 0.0
@@ -1,36 +1,27 @@
 #!/usr/bin/python3.6
 
-import os, pickle, sys
-from glob import glob
-from tqdm import tqdm
-from PIL import Image
-import numpy as np
+import os, sys
 from scipy.stats import describe
 import matplotlib.pyplot as plt
 from debug import dprint
+from image_index import load_index
 
 
 directory = sys.argv[1]
-cache_path = f'../cache/sizes_{os.path.basename(directory)}.pkl'
-os.makedirs(os.path.basename(cache_path), exist_ok=True)
+index = load_index(f'../input/{directory}/')
 
-if os.path.exists(cache_path):
-    sizes = pickle.load(open(cache_path, 'rb'))
-else:
-    sizes = [np.array(Image.open(path)).shape for path in tqdm(sorted(glob(f'../input/{directory}/*.png')))]
-    with open(cache_path, 'wb') as f:
-        pickle.dump(sizes, f)
-
-widths = [s[0] for s in sizes]
-heights = [s[1] for s in sizes]
-ratios = [s[0] / s[1] for s in sizes]
+widths = index.width.values
+heights = index.height.values
+ratios = widths / heights      # width / height, the pickle-based version plotted height / width
 
 dprint(describe(widths))
 dprint(describe(heights))
+dprint(index['mode'].value_counts())
+dprint(describe(index.file_size.values))
 
 for sz in [288, 320, 352, 384]:
-    print('num images greater than', sz, 'is', len([s for s in sizes if s[0] > sz and s[1] > sz]))
+    print('num images greater than', sz, 'is', ((widths > sz) & (heights > sz)).sum())
 
-# plt.plot(ratios); plt.show()
+# plt.plot(ratios); plt.ylabel('width / height'); plt.show()
 # plt.plot(widths); plt.show()
 # plt.plot(heights); plt.show()